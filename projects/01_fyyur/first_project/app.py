@@ -2,125 +2,342 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+# dateutil, babel and flask_migrate are imported where they are used, they
+# add a good part of the startup time of a worker that may never need them
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from flask import Flask, Blueprint, current_app, render_template, request, Response, flash, redirect, url_for, jsonify, abort, stream_with_context
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import form
 from forms import *
-from flask_migrate import Migrate
 import sys
+import time
+import click
 import itertools
+from datetime import datetime, timedelta
+from models import db, Venue, Artist, Show, Recommendation, StatCounter
+from autocomplete import PrefixIndex
+from recommend import cooccurrence, scores, top
+from stats import VENUE_STATS, ARTIST_STATS, SHOW_STATS, venue_buckets, artist_buckets, show_buckets, count
+from export import FORMATS, export_chunks
+from replicas import read_only, init_app as init_replicas
+from geo import GeocodingTable, bounding_box, covering_prefixes, encode_geohash, haversine_km
+
+# every view, filter, error handler and command, registered by create_app()
+bp = Blueprint('fyyur', __name__, cli_group=None)
+
 #----------------------------------------------------------------------------#
-# App Config.
+# Autocomplete.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+# names of the artists and venues by prefix, for the pickers of the new show
+# form. Loaded on the first suggestion, then updated by the create, edit and
+# delete controllers of this process.
+artist_index = PrefixIndex(lambda: Artist.query.with_entities(Artist.id, Artist.name).all())
+venue_index = PrefixIndex(lambda: Venue.query.with_entities(Venue.id, Venue.name).all())
 
-# TODO: connect to a local postgresql database - done
+#----------------------------------------------------------------------------#
+# Geolocation.
+#----------------------------------------------------------------------------#
+
+def geocoder():
+  # the geocoding table of the app, read on first use
+  table = current_app.extensions.get('geocoder')
+  if table is None:
+    table = current_app.extensions['geocoder'] = GeocodingTable(current_app.config['GEOCODING_TABLE'])
+  return table
+
+def locate_venue(venue):
+  # coordinates of the venue's address, or of its city, from the geocoding table
+  location = geocoder().locate(venue.address, venue.city, venue.state)
+  if location is None:
+    venue.latitude = venue.longitude = venue.geohash = None
+  else:
+    venue.latitude, venue.longitude = location
+    venue.geohash = encode_geohash(*location)
+
+def venues_near(latitude, longitude, radius_km=None, limit=10):
+  # the venues closest to a point, within radius_km if given, ranked by distance.
+  # Candidates are read through the geohash index, from a ring that grows
+  # until it holds limit venues (or reaches radius_km), then ranked exactly.
+  ring_km = 5.0 if radius_km is None else min(5.0, radius_km)
+  while True:
+    prefixes = covering_prefixes(latitude, longitude, ring_km)
+    query = Venue.query.with_entities(
+      Venue.id, Venue.name, Venue.city, Venue.state, Venue.latitude, Venue.longitude
+    ).filter(Venue.geohash.isnot(None))
+    if prefixes:
+      query = query.filter(db.or_(*[Venue.geohash.like(prefix + '%') for prefix in prefixes]))
+      # leave out the corners of the cells before computing distances
+      d_lat, d_lng = bounding_box(latitude, ring_km)
+      query = query.filter(Venue.latitude.between(latitude - d_lat, latitude + d_lat))
+      if abs(longitude) + d_lng < 180:
+        query = query.filter(Venue.longitude.between(longitude - d_lng, longitude + d_lng))
+
+    found = []
+    for venue in query:
+      distance = haversine_km(latitude, longitude, venue.latitude, venue.longitude)
+      if distance <= ring_km:
+        found.append((distance, venue))
+    if len(found) >= limit or not prefixes or (radius_km is not None and ring_km >= radius_km):
+      break
+    ring_km = ring_km * 4 if radius_km is None else min(ring_km * 4, radius_km)
+
+  found.sort(key=lambda item: (item[0], item[1].id))
+  return found[:limit]
 
 #----------------------------------------------------------------------------#
-# Models.
+# Recommendations.
 #----------------------------------------------------------------------------#
 
-class Venue(db.Model):
-    __tablename__ = 'venue'
-
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String, unique=True)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    address = db.Column(db.String(120))
-    phone = db.Column(db.String(120), unique=True)
-    genres = db.Column(db.String(120))
-    facebook_link = db.Column(db.String(120), unique=True)
-    image_link = db.Column(db.String(500))
-    website = db.Column(db.String(120))
-    seeking_talent = db.Column(db.Boolean, default=False)
-    seeking_description = db.Column(db.String(300))
-    shows = db.relationship('Show', backref='venue', lazy='dynamic')
-
-    def __repr__(self):
-      return f'''< venue 
-                        id: {self.id},
-                      name: {self.name},
-                      city: {self.city},
-                     state: {self.state} >'''
-
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate - done
-
-class Artist(db.Model):
-    __tablename__ = 'artist'
-
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String, unique=True)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    address = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
-    image_link = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(120), nullable=True, unique=True)
-    website = db.Column(db.String(120))
-    seeking_venue = db.Column(db.Boolean, default=False)
-    seeking_description = db.Column(db.String(300))
-    shows = db.relationship('Show', backref='artist', lazy='dynamic')
-
-    def __repr__(self):
-      return f'''< artist 
-               id: {self.id},
-             name: {self.name},
-             city: {self.city},
-            state: {self.state}>'''
-
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate - done
-
-class Show(db.Model):
-    __tablename__ = 'shows'
-    id = db.Column(db.Integer, primary_key=True)
-    venue_id = db.Column(db.Integer, db.ForeignKey(
-        'venue.id'), nullable=False)
-    artist_id = db.Column(db.Integer, db.ForeignKey(
-        'artist.id'), nullable=False)
-    start_time = db.Column(db.DateTime(), nullable=False)
-
-    def __repr__(self):
-      return f'''\n
-            Show: {self.id} 
-           Venue: {self.venue.name} 
-          Artist: {self.artist.name}
-      start_time: {self.start_time} '''
-
-
-# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration. - done
+def refresh_recommendations(k=None):
+  # batch job: rebuilds the artist x venue matrix from every show and replaces
+  # the top k recommendations of every artist and venue in one transaction
+  k = k or current_app.config['RECOMMENDATIONS_TOP_K']
+  by_artist, by_venue = cooccurrence(db.session.query(Show.artist_id, Show.venue_id))
+  seeking_venue = {id for id, in Artist.query.with_entities(Artist.id).filter(Artist.seeking_venue.is_(True))}
+  seeking_talent = {id for id, in Venue.query.with_entities(Venue.id).filter(Venue.seeking_talent.is_(True))}
+
+  rows = []
+  def ranked(kind, source_id, best):
+    rows.extend({"kind": kind, "source_id": source_id, "rank": rank, "target_id": target_id, "score": score}
+                for rank, (target_id, score) in enumerate(best, 1))
+
+  for artist_id, scored in scores(by_artist, by_venue):
+    ranked('artist-venues', artist_id, top(scored, k))
+    if artist_id in seeking_venue:
+      ranked('artist-matches', artist_id, top(scored, k, seeking_talent))
+  for venue_id, scored in scores(by_venue, by_artist):
+    ranked('venue-artists', venue_id, top(scored, k))
+    if venue_id in seeking_talent:
+      ranked('venue-matches', venue_id, top(scored, k, seeking_venue))
+
+  try:
+    Recommendation.query.delete()
+    db.session.bulk_insert_mappings(Recommendation, rows)
+    db.session.commit()
+  except:
+    db.session.rollback()
+    raise
+  return len(rows)
+
+def recommendations(kind, source_id, target):
+  # the precomputed recommendations of one artist or venue, best first, with
+  # the targets that still exist
+  return Recommendation.query.join(target, target.id == Recommendation.target_id).with_entities(
+    target.id, target.name, target.city, target.state, Recommendation.score
+  ).filter(Recommendation.kind == kind, Recommendation.source_id == source_id) \
+    .order_by(Recommendation.rank).all()
+
+def recommendations_response(kind, source_id, seeking, found):
+  return jsonify({
+    kind + "_id": source_id,
+    "seeking": seeking,
+    "count": len(found),
+    "data": [{
+      "id": item.id,
+      "name": item.name,
+      "city": item.city,
+      "state": item.state,
+      "score": round(item.score, 4)
+    } for item in found]
+  })
+
+#----------------------------------------------------------------------------#
+# Analytics.
+#----------------------------------------------------------------------------#
+
+def refresh_stats():
+  # full rebuild of the counters from the tables, for the first run and
+  # to fix any drift, e.g. nightly
+  totals = count(Venue.query.with_entities(*[getattr(Venue, column) for column in VENUE_STATS]), venue_buckets)
+  totals.update(count(Artist.query.with_entities(*[getattr(Artist, column) for column in ARTIST_STATS]), artist_buckets))
+  totals.update(count(Show.query.with_entities(*[getattr(Show, column) for column in SHOW_STATS]), show_buckets))
+  try:
+    StatCounter.query.delete()
+    db.session.bulk_insert_mappings(StatCounter, [
+      {"metric": metric, "bucket": bucket, "total": total} for (metric, bucket), total in totals.items()])
+    db.session.commit()
+  except:
+    db.session.rollback()
+    raise
+  return len(totals)
+
+def stat_rows(metric, limit=None, by_bucket=False):
+  # (bucket, total) rows of a metric, largest first through the
+  # (metric, total) index, or in bucket order through the primary key
+  query = StatCounter.query.with_entities(StatCounter.bucket, StatCounter.total) \
+    .filter(StatCounter.metric == metric, StatCounter.total > 0)
+  if by_bucket:
+    query = query.order_by(StatCounter.bucket)
+  else:
+    query = query.order_by(StatCounter.total.desc(), StatCounter.bucket)
+  return query.limit(limit).all()
+
+def ratio(part, whole):
+  return round(part / whole, 4) if whole else None
+
+def analytics_data(limit=10):
+  # the dashboard, read from the counters only
+  totals = dict(stat_rows('totals'))
+  cities = stat_rows('venues_by_city', limit)
+  seeking = dict(StatCounter.query.with_entities(StatCounter.bucket, StatCounter.total).filter(
+    StatCounter.metric == 'seeking_venues_by_city', StatCounter.bucket.in_([city for city, _ in cities])))
+  top_artists = stat_rows('artist_shows', limit)
+  names = dict(Artist.query.with_entities(Artist.id, Artist.name).filter(
+    Artist.id.in_([int(artist_id) for artist_id, _ in top_artists]))) if top_artists else {}
+
+  return {
+    "totals": {
+      "venues": totals.get('venues', 0),
+      "artists": totals.get('artists', 0),
+      "shows": totals.get('shows', 0),
+      "seeking_talent_ratio": ratio(totals.get('seeking_venues', 0), totals.get('venues', 0)),
+      "seeking_venue_ratio": ratio(totals.get('seeking_artists', 0), totals.get('artists', 0))
+    },
+    "venues_per_city": [{
+      "city": city,
+      "venues": total,
+      "seeking_talent": seeking.get(city, 0),
+      "seeking_talent_ratio": ratio(seeking.get(city, 0), total)
+    } for city, total in cities],
+    "shows_per_month": [{"month": month, "shows": total}
+                        for month, total in stat_rows('shows_by_month', by_bucket=True)],
+    "top_venue_genres": [{"genre": genre, "venues": total}
+                         for genre, total in stat_rows('venue_genres', limit)],
+    "top_artist_genres": [{"genre": genre, "artists": total}
+                          for genre, total in stat_rows('artist_genres', limit)],
+    "most_booked_artists": [{"id": int(artist_id), "name": names.get(int(artist_id)), "shows": total}
+                            for artist_id, total in top_artists]
+  }
+
+#----------------------------------------------------------------------------#
+# Exports.
+#----------------------------------------------------------------------------#
+
+EXPORT_MODELS = {'venues': Venue, 'artists': Artist, 'shows': Show}
+# rows fetched per round trip, yield_per() also turns on stream_results so
+# that postgres reads them from a server side cursor
+EXPORT_BATCH = 1000
+
+def export_query(kind, joined=False):
+  # column names and rows of an export in id order, streamed. joined adds
+  # the names of the artist and venue of every show.
+  if kind == 'shows' and joined:
+    columns = [Show.id, Show.start_time, Show.end_time,
+               Show.artist_id, Artist.name.label('artist_name'),
+               Show.venue_id, Venue.name.label('venue_name'),
+               Venue.city.label('venue_city'), Venue.state.label('venue_state')]
+    query = db.session.query(*columns).join(Artist, Artist.id == Show.artist_id) \
+      .join(Venue, Venue.id == Show.venue_id)
+  else:
+    model = EXPORT_MODELS[kind]
+    columns = [getattr(model, column.key) for column in model.__table__.columns]
+    query = db.session.query(*columns)
+  names = [column.key for column in columns]
+  return names, query.order_by(columns[0]).yield_per(EXPORT_BATCH)
+
+#----------------------------------------------------------------------------#
+# Calendars.
+#----------------------------------------------------------------------------#
+
+CALENDAR_DEFAULT_DAYS = 30
+CALENDAR_MAX_DAYS = 366
+
+def overlapping(window_start, window_end):
+  # filters for the shows overlapping the window. Next to an equality on
+  # venue_id or artist_id, the start_time bounds make it a range scan of the
+  # (venue_id, start_time) or (artist_id, start_time) index: a show starting
+  # more than Show.MAX_DURATION before the window is over before it begins.
+  return (
+    Show.start_time > window_start - Show.MAX_DURATION,
+    Show.start_time < window_end,
+    Show.end_time > window_start
+  )
+
+def booked_slots(column, entity_id, window_start, window_end):
+  # the shows of one venue or artist overlapping the window, earliest first,
+  # with the names of the artists and venues they bring together
+  return Show.query.join(Artist).join(Venue).with_entities(
+    Show.id, Show.start_time, Show.end_time,
+    Show.artist_id, Artist.name.label('artist_name'),
+    Show.venue_id, Venue.name.label('venue_name')
+  ).filter(column == entity_id, *overlapping(window_start, window_end)) \
+    .order_by(Show.start_time, Show.id).all()
+
+def free_venues(city, state, day_start, day_end):
+  # venues of the city without a show overlapping the day, through the
+  # (city, state) index and one correlated NOT EXISTS range scan per venue
+  booked = db.session.query(Show.id).filter(
+    Show.venue_id == Venue.id, *overlapping(day_start, day_end))
+  return Venue.query.with_entities(
+    Venue.id, Venue.name, Venue.address, Venue.phone
+  ).filter(Venue.city == city, Venue.state == state, ~booked.exists()) \
+    .order_by(Venue.name, Venue.id).all()
+
+def calendar_window():
+  # the ?from=&to= window of a calendar, today and the following
+  # CALENDAR_DEFAULT_DAYS by default, aborts on a bad or too long window
+  today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+  try:
+    window_start = parse_datetime(request.args['from'], ignoretz=True) \
+      if request.args.get('from') else today
+    window_end = parse_datetime(request.args['to'], ignoretz=True) \
+      if request.args.get('to') else window_start + timedelta(days=CALENDAR_DEFAULT_DAYS)
+  except (ValueError, OverflowError):
+    abort(400)
+  if window_end <= window_start or window_end - window_start > timedelta(days=CALENDAR_MAX_DAYS):
+    abort(400)
+  return window_start, window_end
+
+def calendar_response(kind, entity_id, window_start, window_end, slots):
+  return jsonify({
+    kind + "_id": entity_id,
+    "from": window_start.isoformat(),
+    "to": window_end.isoformat(),
+    "count": len(slots),
+    "slots": [{
+      "show_id": slot.id,
+      "artist_id": slot.artist_id,
+      "artist_name": slot.artist_name,
+      "venue_id": slot.venue_id,
+      "venue_name": slot.venue_name,
+      "start_time": slot.start_time.isoformat(),
+      "end_time": slot.end_time.isoformat()
+    } for slot in slots]
+  })
+
+def flash_form_errors(form, kind):
+  flash(f'The {kind} data is not valid. Please try again.')
+  for field, errors in form.errors.items():
+    for error in errors:
+      flash(field + ' : ' + error + '\n')
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
+def parse_datetime(value, **options):
+  import dateutil.parser
+  return dateutil.parser.parse(value, **options)
+
+@bp.app_template_filter('datetime')
 def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
+  import babel.dates
+  date = parse_datetime(value)
   if format == 'full':
       format="EEEE MMMM, d, y 'at' h:mma"
   elif format == 'medium':
       format="EE MM, dd, y h:mma"
   return babel.dates.format_datetime(date, format)
 
-app.jinja_env.filters['datetime'] = format_datetime
-
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@bp.route('/')
+@read_only
 def index():
   # Stand out
   # Show Recent Listed Artists and Recently Listed Venues on the homepage, - done 
@@ -133,10 +350,46 @@ def index():
   return render_template('pages/home.html', recent_venues = recent_venues, recent_artists = recent_artists)
 
 
+#  Exports
+#  --------------------------------------------------------------------------#
+
+@bp.route('/export/<kind>')
+@read_only
+def export(kind):
+  # every venue, artist or show as ?format=csv (default) or ndjson,
+  # ?joined=1 adds the artist and venue names to shows
+  format = request.args.get('format', 'csv')
+  if kind not in EXPORT_MODELS:
+    abort(404)
+  if format not in FORMATS:
+    abort(400)
+  names, rows = export_query(kind, request.args.get('joined') == '1')
+  # the rows are read while the response is sent, in the request's context
+  return Response(stream_with_context(export_chunks(format, names, rows)), mimetype=FORMATS[format],
+                  headers={'Content-Disposition': f'attachment; filename={kind}.{format}'})
+
+
+#  Analytics
+#  --------------------------------------------------------------------------#
+
+@bp.route('/analytics')
+@read_only
+def analytics():
+  return render_template('pages/analytics.html', stats=analytics_data())
+
+@bp.route('/analytics/stats')
+@read_only
+def analytics_stats():
+  # ?limit= rows of each top list, 10 by default, 100 at most
+  limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+  return jsonify(analytics_data(limit))
+
+
 #  Venues
 #  --------------------------------------------------------------------------#
 
-@app.route('/venues')
+@bp.route('/venues')
+@read_only
 def venues():
   # TODO: replace with real venues data. - done
   #       num_shows should be aggregated based on number of upcoming shows per venue. - done
@@ -166,7 +419,8 @@ def venues():
 
   return render_template('pages/venues.html', areas=data)
 
-@app.route('/venues/search', methods=['POST'])
+@bp.route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
   # TODO: implement search on venues with partial string search. Ensure it is case-insensitive. - done
   # seach for Hop should return "The Musical Hop". - done
@@ -200,7 +454,100 @@ def search_venues():
     })
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
-@app.route('/venues/<int:venue_id>')
+@bp.route('/venues/near')
+@read_only
+def venues_near_me():
+  # venues near a point (?lat=&lng=) or a city (?city=&state=), closest first,
+  # within ?radius= km if given, ?upcoming=1 adds their upcoming show counts
+  latitude = request.args.get('lat', type=float)
+  longitude = request.args.get('lng', type=float)
+  if latitude is None or longitude is None:
+    location = geocoder().locate(None, request.args.get('city'), request.args.get('state'))
+    if location is None:
+      abort(400)
+    latitude, longitude = location
+  if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+    abort(400)
+  radius_km = request.args.get('radius', type=float)
+  if radius_km is not None and radius_km < 0:
+    abort(400)
+  limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+
+  found = venues_near(latitude, longitude, radius_km, limit)
+  data = [{
+    "id": venue.id,
+    "name": venue.name,
+    "city": venue.city,
+    "state": venue.state,
+    "distance_km": round(distance, 3)
+  } for distance, venue in found]
+
+  if request.args.get('upcoming') == '1' and data:
+    counts = dict(db.session.query(Show.venue_id, db.func.count(Show.id)).filter(
+      Show.venue_id.in_([item["id"] for item in data]),
+      Show.start_time > datetime.now()
+    ).group_by(Show.venue_id).all())
+    for item in data:
+      item["num_upcoming_shows"] = counts.get(item["id"], 0)
+
+  return jsonify({
+    "origin": {"lat": latitude, "lng": longitude},
+    "count": len(data),
+    "data": data
+  })
+
+@bp.route('/venues/free')
+@read_only
+def venues_free():
+  # venues of ?city=&state= with no show on ?date= (YYYY-MM-DD, today by default)
+  city = ' '.join(request.args.get('city', '').split())
+  state = request.args.get('state', '').strip().upper()
+  if not city or not state:
+    abort(400)
+  try:
+    day = parse_datetime(request.args['date'], ignoretz=True) \
+      if request.args.get('date') else datetime.now()
+  except (ValueError, OverflowError):
+    abort(400)
+  day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
+
+  found = free_venues(city, state, day_start, day_start + timedelta(days=1))
+  return jsonify({
+    "city": city,
+    "state": state,
+    "date": day_start.date().isoformat(),
+    "count": len(found),
+    "data": [{
+      "id": venue.id,
+      "name": venue.name,
+      "address": venue.address,
+      "phone": venue.phone
+    } for venue in found]
+  })
+
+@bp.route('/venues/<int:venue_id>/calendar')
+@read_only
+def venue_calendar(venue_id):
+  # booked slots of the venue over ?from=&to=
+  window_start, window_end = calendar_window()
+  if not Venue.query.with_entities(Venue.id).filter_by(id=venue_id).first():
+    abort(404)
+  slots = booked_slots(Show.venue_id, venue_id, window_start, window_end)
+  return calendar_response('venue', venue_id, window_start, window_end, slots)
+
+@bp.route('/venues/<int:venue_id>/recommendations')
+@read_only
+def venue_recommendations(venue_id):
+  # artists who played venues like this one, ?seeking=1 for the artists
+  # seeking a venue when this one is seeking talent
+  seeking = request.args.get('seeking') == '1'
+  found = recommendations('venue-matches' if seeking else 'venue-artists', venue_id, Artist)
+  if not found and not Venue.query.with_entities(Venue.id).filter_by(id=venue_id).first():
+    abort(404)
+  return recommendations_response('venue', venue_id, seeking, found)
+
+@bp.route('/venues/<int:venue_id>')
+@read_only
 def show_venue(venue_id):
   # shows the venue page with the given venue_id - done
   # TODO: replace with real venue data from the venues table, using venue_id - done 
@@ -329,17 +676,18 @@ def show_venue(venue_id):
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@bp.route('/venues/create', methods=['GET'])
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@bp.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   # TODO: insert form data as a new Venue record in the db, instead - done
   # TODO: modify data to be the data object returned from db insertion - done
   form = VenueForm(request.form, meta={'csrf': False})
-  if form.validate():
+  # invalid or already taken values are rejected before anything is written
+  if form.validate() and form.validate_unique(Venue):
     try:
       # venue = Venue(
       #   name = form.name.data,
@@ -352,8 +700,10 @@ def create_venue_submission():
       # )
       venue = Venue()
       form.populate_obj(venue)
+      locate_venue(venue)
       db.session.add(venue)
       db.session.commit()
+      venue_index.add(venue.id, venue.name)
       # on successful db insert, flash success
       flash('Venue: ' + request.form['name'] + ' was successfully listed!')
     except:
@@ -367,16 +717,10 @@ def create_venue_submission():
     finally:
       db.session.close()
   else:
-    messages = []
-    for field, errors in form.errors.items():
-      for error in errors:
-        messages.append(field + ' : ' + error + '\n')
-    flash('The Venue data is not valid. Please try again.')
-    for message in messages:
-      flash(message)
+    flash_form_errors(form, 'Venue')
   return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>/delete', methods=['POST'])
+@bp.route('/venues/<venue_id>/delete', methods=['POST'])
 def delete_venue(venue_id):
   # TODO: Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
@@ -385,6 +729,7 @@ def delete_venue(venue_id):
     venue = Venue.query.get(venue_id)
     db.session.delete(venue)
     db.session.commit()
+    venue_index.remove(venue.id)
     flash(f'Venue: {venue.name} was successfully deleted!')
   except:
     error = True
@@ -394,7 +739,7 @@ def delete_venue(venue_id):
   if error:
     abort(500)
   else:
-    return redirect(url_for('index'))
+    return redirect(url_for('fyyur.index'))
 
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage - done
@@ -402,7 +747,8 @@ def delete_venue(venue_id):
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@bp.route('/artists')
+@read_only
 def artists():
   # TODO: replace with real data returned from querying the database - done
   artist_query = Artist.query.order_by(Artist.name).all()
@@ -420,7 +766,8 @@ def artists():
 
 
 
-@app.route('/artists/search', methods=['POST'])
+@bp.route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive. - done
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band". - done
@@ -456,7 +803,29 @@ def search_artists():
 
   return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
-@app.route('/artist/<int:artist_id>')
+@bp.route('/artists/<int:artist_id>/calendar')
+@read_only
+def artist_calendar(artist_id):
+  # booked slots of the artist over ?from=&to=
+  window_start, window_end = calendar_window()
+  if not Artist.query.with_entities(Artist.id).filter_by(id=artist_id).first():
+    abort(404)
+  slots = booked_slots(Show.artist_id, artist_id, window_start, window_end)
+  return calendar_response('artist', artist_id, window_start, window_end, slots)
+
+@bp.route('/artists/<int:artist_id>/recommendations')
+@read_only
+def artist_recommendations(artist_id):
+  # venues that booked artists like this one, ?seeking=1 for the venues
+  # seeking talent when this artist is seeking a venue
+  seeking = request.args.get('seeking') == '1'
+  found = recommendations('artist-matches' if seeking else 'artist-venues', artist_id, Venue)
+  if not found and not Artist.query.with_entities(Artist.id).filter_by(id=artist_id).first():
+    abort(404)
+  return recommendations_response('artist', artist_id, seeking, found)
+
+@bp.route('/artist/<int:artist_id>')
+@read_only
 def show_artist(artist_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id - done
@@ -577,18 +946,18 @@ def show_artist(artist_id):
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@bp.route('/artists/create', methods=['GET'])
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@bp.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
   # TODO: insert form data as a new Artist record in the db, instead - done
   # TODO: modify data to be the data object returned from db insertion - done
   form = ArtistForm(request.form, meta={'csrf': False})
-  if form.validate():
+  if form.validate() and form.validate_unique(Artist):
       try:
         # alternative way to populate fields from line 603:
         # artist = Artist(
@@ -604,6 +973,7 @@ def create_artist_submission():
         form.populate_obj(artist)
         db.session.add(artist)
         db.session.commit()
+        artist_index.add(artist.id, artist.name)
         # on successful db insert, flash success
         flash('Artist: ' + request.form['name'] + ' was successfully listed!')
       except:
@@ -617,13 +987,7 @@ def create_artist_submission():
       finally:
         db.session.close()
   else:
-    messages = []
-    for field, errors in form.errors.items():
-      for error in errors:
-        messages.append(field + ' : ' + error + '\n')
-    flash('The Artist data is not valid. Please try again.')
-    for message in messages:
-      flash(message)
+    flash_form_errors(form, 'Artist')
 
   # on successful db insert, flash success - done
   # TODO: on unsuccessful db insert, flash an error instead. - done
@@ -631,10 +995,28 @@ def create_artist_submission():
   return render_template('pages/home.html')
 
 
+#  Autocomplete
+#  ----------------------------------------------------------------
+
+@bp.route('/autocomplete/<kind>')
+@read_only
+def autocomplete(kind):
+  # suggestions for the artist and venue pickers, served from memory
+  indexes = {'artists': artist_index, 'venues': venue_index}
+  if kind not in indexes:
+    abort(404)
+  prefix = request.args.get('q', '')
+  limit = min(request.args.get('limit', 10, type=int), 50)
+  # reloaded when older than AUTOCOMPLETE_MAX_AGE, for the writes of other workers
+  max_age = current_app.config.get('AUTOCOMPLETE_MAX_AGE', 0)
+  return jsonify({'data': indexes[kind].search(prefix, limit, max_age)})
+
+
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@bp.route('/shows')
+@read_only
 def shows():
   # displays list of shows at /shows
   # TODO: replace with real venues data. - done
@@ -688,13 +1070,13 @@ def shows():
   # }]
   return render_template('pages/shows.html', shows=data)
 
-@app.route('/shows/create')
+@bp.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@bp.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form - done
   # TODO: insert form data as a new Show record in the db, instead - done
@@ -704,7 +1086,9 @@ def create_show_submission():
       show = Show(
         artist_id = form.artist_id.data,
         venue_id = form.venue_id.data,
-        start_time = form.start_time.data
+        start_time = form.start_time.data,
+        end_time = form.start_time.data + (timedelta(minutes=form.duration.data)
+          if form.duration.data else Show.DEFAULT_DURATION)
       )
       db.session.add(show)
       db.session.commit()
@@ -733,7 +1117,7 @@ def create_show_submission():
 
 #  Update Venues & Artists
 #  ----------------------------------------------------------------
-@app.route('/artist/<int:artist_id>/edit', methods=['GET'])
+@bp.route('/artist/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   artist = Artist.query.get(artist_id)
   form = ArtistForm(obj=artist)
@@ -762,11 +1146,14 @@ def edit_artist(artist_id):
   # TODO: populate form with fields from artist with ID <artist_id> - done
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
-@app.route('/artist/<int:artist_id>/edit', methods=['POST'])
+@bp.route('/artist/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes - done
-  form_artist = ArtistForm(request.form)
+  form_artist = ArtistForm(request.form, meta={'csrf': False})
+  if not (form_artist.validate() and form_artist.validate_unique(Artist, artist_id)):
+    flash_form_errors(form_artist, 'Artist')
+    return redirect(url_for('fyyur.edit_artist', artist_id=artist_id))
   db_artist = Artist.query.get(artist_id)
   error = False
   try:
@@ -778,6 +1165,7 @@ def edit_artist_submission(artist_id):
     db_artist.facebook_link = form_artist.facebook_link.data
     db.session.add(db_artist)
     db.session.commit()
+    artist_index.add(artist_id, db_artist.name)
   except ValueError as e:
     print(e)
     error = True
@@ -789,9 +1177,9 @@ def edit_artist_submission(artist_id):
       flash('An error occurred. Artist could not be updated.')
     db.session.close()
 
-  return redirect(url_for('show_artist', artist_id=artist_id))
+  return redirect(url_for('fyyur.show_artist', artist_id=artist_id))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   venue = Venue.query.get(venue_id)
   form = VenueForm(obj=venue)
@@ -825,12 +1213,15 @@ def edit_venue(venue_id):
   # TODO: populate form with values from venue with ID <venue_id> - done
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing - done
   # venue record with ID <venue_id> using the new attributes - done
+  form_venue = VenueForm(request.form, meta={'csrf': False})
+  if not (form_venue.validate() and form_venue.validate_unique(Venue, venue_id)):
+    flash_form_errors(form_venue, 'Venue')
+    return redirect(url_for('fyyur.edit_venue', venue_id=venue_id))
   db_venue = Venue.query.get(venue_id)
-  form_venue = VenueForm(request.form)
   error = False
   try:
 
@@ -844,9 +1235,11 @@ def edit_venue_submission(venue_id):
     db_venue.website = form_venue.website.data
     db_venue.seeking_talent = form_venue.seeking_talent.data
     db_venue.seeking_description = form_venue.seeking_description.data
+    locate_venue(db_venue)
 
     db.session.add(db_venue)
     db.session.commit()
+    venue_index.add(venue_id, db_venue.name)
   except ValueError as e:
     print(e)
     error = True
@@ -857,23 +1250,90 @@ def edit_venue_submission(venue_id):
     else:
       flash('An error occurred. Venue could not be updated.')
     db.session.close()
-  return redirect(url_for('show_venue', venue_id=venue_id))
+  return redirect(url_for('fyyur.show_venue', venue_id=venue_id))
 
 
 
 
+#  Commands
+#  ----------------------------------------------------------------
+
+@bp.cli.command('geocode-venues')
+def geocode_venues():
+  # fills in the coordinates of the venues that have none, e.g. after the
+  # migration that added them or after extending the geocoding table
+  located = 0
+  missing = Venue.query.filter(Venue.geohash.is_(None)).order_by(Venue.id).all()
+  for venue in missing:
+    locate_venue(venue)
+    if venue.geohash is not None:
+      located += 1
+  db.session.commit()
+  print(f'{located} of {len(missing)} venues located')
+
+@bp.cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(EXPORT_MODELS)))
+@click.option('--format', type=click.Choice(sorted(FORMATS)), default='csv', help='csv or ndjson')
+@click.option('--joined', is_flag=True, help='add the artist and venue names to shows')
+@click.option('--output', type=click.File('w'), default='-', help='file written, stdout by default')
+def export_command(kind, format, joined, output):
+  names, rows = export_query(kind, joined)
+  for chunk in export_chunks(format, names, rows):
+    output.write(chunk)
+
+@bp.cli.command('refresh-stats')
+def rebuild_stats():
+  written = refresh_stats()
+  print(f'{written} analytics counters written')
+
+@bp.cli.command('recommendations')
+def compute_recommendations():
+  # run periodically, e.g. nightly from cron, recommendations only change here
+  start = time.perf_counter()
+  written = refresh_recommendations()
+  print(f'{written} recommendations written in {time.perf_counter() - start:.1f}s')
+
+
 #  Error Handlers
 #  --------------------------------------------------------------- 
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
+#----------------------------------------------------------------------------#
+# App Config.
+#----------------------------------------------------------------------------#
+
+def db_command():
+  # whether the app is being built for one of the flask db commands
+  context = click.get_current_context(silent=True)
+  while context is not None:
+    if context.info_name == 'db':
+      return True
+    context = context.parent
+  return False
+
+def create_app(config='config'):
+  # the app, configured from the config module or object given
+  app = Flask(__name__)
+  app.config.from_object(config)
+  Moment(app)
+  db.init_app(app)
+  init_replicas(app, db)
+  # TODO: connect to a local postgresql database - done
+  if db_command():
+    # only the flask db commands need it, flask run and web workers don't
+    # load alembic
+    from flask_migrate import Migrate
+    Migrate(app, db)
+  app.register_blueprint(bp)
+
+  if not app.debug:
     file_handler = FileHandler('error.log')
     file_handler.setFormatter(
         Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
@@ -882,6 +1342,7 @@ if not app.debug:
     file_handler.setLevel(logging.INFO)
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
+  return app
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -889,11 +1350,11 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
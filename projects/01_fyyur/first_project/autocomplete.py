@@ -0,0 +1,106 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+#----------------------------------------------------------------------------#
+# Prefix index for the typeahead of the artist and venue pickers.
+#----------------------------------------------------------------------------#
+
+class PrefixIndex:
+    '''
+    In-memory index of names by prefix: a sorted array of
+    (casefolded words, id) keys searched with bisect, so a suggestion costs a
+    binary search and a short scan instead of a query per keystroke.
+
+    Every word of a name is a starting point, "hop" and "the musical" both
+    find "The Musical Hop". The index is filled from the database by the
+    loader on the first search, then kept up to date with add() and remove()
+    when a record is created, edited or deleted. Each server process has its
+    own index: a search reloads it once it is older than max_age seconds, so
+    the changes made through the other processes show up too.
+    '''
+
+    def __init__(self, loader):
+        self.loader = loader
+        # (keys, names), replaced as a whole on every change so that a
+        # search always reads a matching pair without taking the lock
+        self._index = ([], {})
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entries(id, name):
+        words = (name or '').casefold().split()
+        return [(' '.join(words[start:]), id) for start in range(len(words))]
+
+    def load(self):
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        keys = []
+        names = {}
+        for id, name in self.loader():
+            names[id] = name
+            keys.extend(self._entries(id, name))
+        keys.sort()
+        self._index = (keys, names)
+        self._loaded_at = time.monotonic()
+
+    def _stale(self, max_age):
+        return self._loaded_at is None or (
+            max_age and time.monotonic() - self._loaded_at > max_age)
+
+    def add(self, id, name):
+        # also used on edit, the entries of the previous name are replaced
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            # searches in flight keep reading the previous arrays
+            keys, names = list(self._index[0]), dict(self._index[1])
+            self._discard(keys, names, id)
+            names[id] = name
+            for key in self._entries(id, name):
+                insort(keys, key)
+            self._index = (keys, names)
+
+    def remove(self, id):
+        with self._lock:
+            if self._loaded_at is not None:
+                keys, names = list(self._index[0]), dict(self._index[1])
+                self._discard(keys, names, id)
+                self._index = (keys, names)
+
+    def _discard(self, keys, names, id):
+        name = names.pop(id, None)
+        if name is None:
+            return
+        for key in self._entries(id, name):
+            position = bisect_left(keys, key)
+            if position < len(keys) and keys[position] == key:
+                del keys[position]
+
+    def search(self, prefix, limit=10, max_age=0):
+        if self._stale(max_age):
+            with self._lock:
+                # another search may have reloaded it meanwhile
+                if self._stale(max_age):
+                    self._load()
+        prefix = ' '.join(prefix.casefold().split())
+        if not prefix:
+            return []
+
+        keys, names = self._index
+        results = []
+        seen = set()
+        position = bisect_left(keys, (prefix,))
+        while position < len(keys) and len(results) < limit:
+            key, id = keys[position]
+            if not key.startswith(prefix):
+                break
+            name = names.get(id)
+            if id not in seen and name is not None:
+                seen.add(id)
+                results.append({'id': id, 'name': name})
+            position += 1
+        return results
@@ -0,0 +1,63 @@
+'''
+benchmark_forms.py
+    measures what the venue form costs a request: building it (GET and
+    POST) and validating a submission, with the shared choice tuples and
+    frozenset validators of forms.py against the per-form choice lists and
+    choice scans forms.py used to have
+
+    e.g.
+        python benchmark_forms.py --number 5000
+'''
+import argparse
+import timeit
+
+from flask import Flask
+from werkzeug.datastructures import MultiDict
+from wtforms import SelectField, SelectMultipleField
+from wtforms.validators import DataRequired
+
+from forms import GENRES, STATES, VenueForm
+
+
+class ListChoicesVenueForm(VenueForm):
+    # how forms.py declared the choices before
+    state = SelectField(
+        'state', validators=[DataRequired()],
+        choices=[(state, state) for state in STATES]
+    )
+    genres = SelectMultipleField(
+        'genres', validators=[DataRequired()],
+        choices=[(genre, genre) for genre in GENRES]
+    )
+
+
+SUBMISSION = MultiDict([
+    ('name', 'The Musical Hop'), ('city', 'San Francisco'), ('state', 'WY'),
+    ('address', '1015 Folsom Street'), ('phone', '123-123-1234'),
+    ('genres', 'Jazz'), ('genres', 'Reggae'), ('genres', 'Soul'), ('genres', 'Other'),
+    ('facebook_link', 'https://www.facebook.com/TheMusicalHop'), ('seeking_talent', 'y'),
+])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=2000, help='forms built per measurement')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='benchmark', WTF_CSRF_ENABLED=False)
+    steps = {
+        'build (GET)': lambda form_class: form_class(),
+        'build (POST)': lambda form_class: form_class(SUBMISSION),
+        'build and validate (POST)': lambda form_class: form_class(SUBMISSION).validate(),
+    }
+    with app.test_request_context(method='POST'):
+        assert VenueForm(SUBMISSION).validate() and ListChoicesVenueForm(SUBMISSION).validate()
+        for step, run in steps.items():
+            for form_class in (ListChoicesVenueForm, VenueForm):
+                seconds = min(timeit.repeat(lambda: run(form_class), number=args.number, repeat=5))
+                print(f'{step}, {form_class.__name__}: {seconds / args.number * 1e6:.1f} µs')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+benchmark_startup.py
+    measures the cold start of fyyur in fresh interpreters: importing the
+    models alone (what db_populate.py and scripts need), importing the app
+    and building it with create_app(), and serving a first request
+
+    e.g.
+        python benchmark_startup.py --runs 10
+        python benchmark_startup.py --imports 15
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+STEPS = {
+    'import models': 'import models',
+    'create_app()': 'from app import create_app; create_app()',
+    'first request': "from app import create_app; create_app().test_client().get('/shows/create')",
+}
+
+TIMED = '''
+import time
+start = time.perf_counter()
+{code}
+print(time.perf_counter() - start)
+'''
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure(code, runs):
+    times = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', TIMED.format(code=code)], cwd=HERE,
+                                check=True, capture_output=True, text=True).stdout
+        times.append(float(output.split()[-1]) * 1000)
+    return times
+
+
+def slowest_imports(code, count):
+    # cumulative microseconds of the modules the timed code imports directly
+    # and of their own direct imports, from python -X importtime
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=HERE,
+                            check=True, capture_output=True, text=True).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        if cumulative.strip().isdigit() and depth <= 1:
+            imports.append((int(cumulative), '  ' * depth + name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7, help='fresh interpreters per step')
+    parser.add_argument('--imports', type=int, default=0, help='also list the slowest imports of create_app()')
+    args = parser.parse_args()
+
+    for step, code in STEPS.items():
+        times = measure(code, args.runs)
+        print(f'{step}: median {statistics.median(times):.0f} ms, best {min(times):.0f} ms')
+
+    if args.imports:
+        print('slowest imports of create_app():')
+        for cumulative, name in slowest_imports(STEPS['create_app()'], args.imports):
+            print(f'  {cumulative / 1000:7.1f} ms  {name}')
+
+
+if __name__ == '__main__':
+    main()
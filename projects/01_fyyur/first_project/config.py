@@ -13,3 +13,25 @@ DEBUG = True
 SQLALCHEMY_DATABASE_URI = 'postgres://josejlovaglio@localhost:5432/fyyur'
 
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# read replicas of the database, comma separated URLs, e.g.
+# READ_REPLICA_URLS=postgres://localhost:5433/fyyur,postgres://localhost:5434/fyyur
+# the read-only views are spread over them, writes stay on the primary
+SQLALCHEMY_BINDS = {f'replica{number}': url for number, url in enumerate(
+    [url for url in os.environ.get('READ_REPLICA_URLS', '').split(',') if url], 1)}
+READ_REPLICAS = sorted(SQLALCHEMY_BINDS)
+# seconds a client keeps reading from the primary after writing,
+# longer than the replication lag so that it sees its own writes
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+# offline geocoding table for the venues near me search,
+# address,city,state,latitude,longitude rows (empty address: the whole city)
+GEOCODING_TABLE = os.path.join(basedir, 'data', 'geocoding.csv')
+
+# seconds a server process keeps its autocomplete index before reloading it
+# from the database, to see the artists and venues written by the others
+# (0: only the changes it made itself, until it is restarted)
+AUTOCOMPLETE_MAX_AGE = int(os.environ.get('AUTOCOMPLETE_MAX_AGE', 60))
+
+# recommendations precomputed per artist and per venue by flask recommendations
+RECOMMENDATIONS_TOP_K = 10
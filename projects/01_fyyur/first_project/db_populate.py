@@ -1,4 +1,8 @@
-from app import db, Venue, Artist, Show
+from app import create_app
+from models import db, Venue, Artist, Show
+
+# the models reach the database through an app context
+create_app().app_context().push()
 
 # Populating Artists
 # ------------------------------------------------------------------------------------------------------------------
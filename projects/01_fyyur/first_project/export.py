@@ -0,0 +1,56 @@
+import csv
+import io
+import json
+
+#----------------------------------------------------------------------------#
+# Streaming CSV and NDJSON writers of the exports.
+#----------------------------------------------------------------------------#
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _value(value):
+    # datetimes as ISO 8601 in both formats
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def csv_chunks(columns, rows, rows_per_chunk=500):
+    '''
+    CSV text of the rows, the header line first on its own, then chunks of
+    rows_per_chunk lines, so that only one chunk is ever held in memory
+    '''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for count, row in enumerate(rows, 1):
+        writer.writerow([_value(value) for value in row])
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(columns, rows, rows_per_chunk=500):
+    '''One JSON object per row and per line, in chunks of rows_per_chunk lines'''
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, map(_value, row))), ensure_ascii=False))
+        if len(lines) == rows_per_chunk:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def export_chunks(format, columns, rows):
+    if format == 'csv':
+        return csv_chunks(columns, rows)
+    return ndjson_chunks(columns, rows)
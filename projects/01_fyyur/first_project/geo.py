@@ -0,0 +1,135 @@
+import csv
+import math
+
+#----------------------------------------------------------------------------#
+# Geohashes, distances and offline geocoding for the venues near me search.
+#----------------------------------------------------------------------------#
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_PRECISION = 9
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    '''
+    Geohash of a point: nearby points share a prefix, so a btree index on the
+    geohash column finds the venues of an area with a LIKE 'prefix%' scan.
+    '''
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        value, interval = (longitude, lng_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+
+def cell_size(precision):
+    # height and width in degrees of a geohash cell of that many characters
+    lng_bits = (precision * 5 + 1) // 2
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    lat1 = math.radians(latitude1)
+    lat2 = math.radians(latitude2)
+    d_lat = lat2 - lat1
+    d_lng = math.radians(longitude2 - longitude1)
+    a = math.sin(d_lat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(d_lng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, radius_km):
+    '''
+    Half height and half width in degrees of the box around a circle of
+    radius_km at that latitude, (None, None) if it reaches a pole or wraps
+    around the whole world
+    '''
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    if abs(latitude) + d_lat >= 90:
+        return None, None
+    # widest at the latitude closest to a pole
+    d_lng = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(abs(latitude) + d_lat))))
+    if d_lng >= 180:
+        return None, None
+    return d_lat, d_lng
+
+
+def covering_prefixes(latitude, longitude, radius_km, max_cells=9):
+    '''
+    The geohash prefixes whose cells together cover the circle of radius_km
+    around the point: the cells crossed by its bounding box, at the finest
+    precision where there are at most max_cells of them. An empty list means
+    the whole world has to be scanned.
+    '''
+    d_lat, d_lng = bounding_box(latitude, radius_km)
+    if d_lat is None:
+        return []
+
+    prefixes = []
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = cell_size(precision)
+        latitudes = _steps(latitude - d_lat, latitude + d_lat, height)
+        longitudes = _steps(longitude - d_lng, longitude + d_lng, width)
+        if len(latitudes) * len(longitudes) > max_cells:
+            break
+        # points at most one cell apart hit every cell the box crosses
+        prefixes = sorted({encode_geohash(point_lat, (point_lng + 180.0) % 360.0 - 180.0, precision)
+                           for point_lat in latitudes for point_lng in longitudes})
+    return prefixes
+
+
+def _steps(low, high, step):
+    points = [low + step * i for i in range(int((high - low) / step) + 1)]
+    points.append(high)
+    return points
+
+
+class GeocodingTable:
+    '''
+    Offline geocoder: coordinates by (address, city, state) read from a CSV
+    file with an address,city,state,latitude,longitude header. Rows with an
+    empty address give the coordinates of a whole city, used for addresses
+    the table doesn't list.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._places = None
+
+    @staticmethod
+    def _key(address, city, state):
+        return (' '.join((address or '').casefold().split()),
+                ' '.join((city or '').casefold().split()),
+                (state or '').strip().upper())
+
+    def load(self):
+        places = {}
+        with open(self.path, newline='') as table:
+            for row in csv.DictReader(table):
+                places[self._key(row['address'], row['city'], row['state'])] = (
+                    float(row['latitude']), float(row['longitude']))
+        self._places = places
+        return places
+
+    def locate(self, address, city, state):
+        '''(latitude, longitude) of the address, or of its city, or None'''
+        places = self._places if self._places is not None else self.load()
+        key = self._key(address, city, state)
+        return places.get(key) or places.get(('',) + key[1:])
@@ -0,0 +1,31 @@
+"""summary counters of the analytics dashboard
+
+Revision ID: 4d7a92c1e5f8
+Revises: e81d4b6f2c35
+Create Date: 2026-10-19 17:22:10.113406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d7a92c1e5f8'
+down_revision = 'e81d4b6f2c35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stat_counter',
+    sa.Column('metric', sa.String(length=40), nullable=False),
+    sa.Column('bucket', sa.String(length=250), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('metric', 'bucket')
+    )
+    op.create_index('ix_stat_counter_metric_total', 'stat_counter', ['metric', 'total'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_stat_counter_metric_total', table_name='stat_counter')
+    op.drop_table('stat_counter')
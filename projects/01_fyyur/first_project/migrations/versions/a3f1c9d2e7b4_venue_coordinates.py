@@ -0,0 +1,33 @@
+"""venue coordinates and geohash index
+
+Revision ID: a3f1c9d2e7b4
+Revises: 9be0bdf23496
+Create Date: 2026-10-19 10:12:41.318094
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f1c9d2e7b4'
+down_revision = '9be0bdf23496'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('venue', sa.Column('geohash', sa.String(length=12), nullable=True))
+    # pattern ops so that geohash LIKE 'prefix%' can use the index whatever the collation
+    op.create_index('ix_venue_geohash', 'venue', ['geohash'], unique=False,
+                    postgresql_ops={'geohash': 'varchar_pattern_ops'})
+    # fill in the coordinates of the existing venues with: flask geocode-venues
+
+
+def downgrade():
+    op.drop_index('ix_venue_geohash', table_name='venue')
+    op.drop_column('venue', 'geohash')
+    op.drop_column('venue', 'longitude')
+    op.drop_column('venue', 'latitude')
@@ -0,0 +1,38 @@
+"""show end time and time range indexes
+
+Revision ID: c52e8b7a1d09
+Revises: a3f1c9d2e7b4
+Create Date: 2026-10-19 14:37:02.561873
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52e8b7a1d09'
+down_revision = 'a3f1c9d2e7b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('shows', sa.Column('end_time', sa.DateTime(), nullable=True))
+    # existing shows get the default duration of 2 hours
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("UPDATE shows SET end_time = start_time + interval '2 hours'")
+    else:
+        op.execute("UPDATE shows SET end_time = datetime(start_time, '+2 hours')")
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_venue_city_state', 'venue', ['city', 'state'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_venue_city_state', table_name='venue')
+    op.drop_index('ix_shows_artist_id_start_time', table_name='shows')
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
+    op.drop_column('shows', 'end_time')
@@ -0,0 +1,31 @@
+"""precomputed recommendations
+
+Revision ID: e81d4b6f2c35
+Revises: c52e8b7a1d09
+Create Date: 2026-10-19 16:05:48.902117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e81d4b6f2c35'
+down_revision = 'c52e8b7a1d09'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('recommendation',
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('source_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('target_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'source_id', 'rank')
+    )
+
+
+def downgrade():
+    op.drop_table('recommendation')
@@ -0,0 +1,197 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+from datetime import timedelta
+from sqlalchemy import event, text
+from replicas import RoutingSQLAlchemy
+from stats import VENUE_STATS, ARTIST_STATS, SHOW_STATS, venue_buckets, artist_buckets, show_buckets
+
+# bound to the app by create_app() in app.py
+db = RoutingSQLAlchemy()
+
+#----------------------------------------------------------------------------#
+# Models.
+#----------------------------------------------------------------------------#
+
+class Venue(db.Model):
+    __tablename__ = 'venue'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, unique=True)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    address = db.Column(db.String(120))
+    phone = db.Column(db.String(120), unique=True)
+    genres = db.Column(db.String(120))
+    facebook_link = db.Column(db.String(120), unique=True)
+    image_link = db.Column(db.String(500))
+    website = db.Column(db.String(120))
+    seeking_talent = db.Column(db.Boolean, default=False)
+    seeking_description = db.Column(db.String(300))
+    # filled in from the geocoding table, see locate_venue()
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))
+    shows = db.relationship('Show', backref='venue', lazy='dynamic')
+
+    __table_args__ = (
+        db.Index('ix_venue_geohash', 'geohash', postgresql_ops={'geohash': 'varchar_pattern_ops'}),
+        db.Index('ix_venue_city_state', 'city', 'state'),
+    )
+
+    def __repr__(self):
+      return f'''< venue 
+                        id: {self.id},
+                      name: {self.name},
+                      city: {self.city},
+                     state: {self.state} >'''
+
+    # TODO: implement any missing fields, as a database migration using Flask-Migrate - done
+
+class Artist(db.Model):
+    __tablename__ = 'artist'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, unique=True)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    address = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    genres = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120), nullable=True, unique=True)
+    website = db.Column(db.String(120))
+    seeking_venue = db.Column(db.Boolean, default=False)
+    seeking_description = db.Column(db.String(300))
+    shows = db.relationship('Show', backref='artist', lazy='dynamic')
+
+    def __repr__(self):
+      return f'''< artist 
+               id: {self.id},
+             name: {self.name},
+             city: {self.city},
+            state: {self.state}>'''
+
+    # TODO: implement any missing fields, as a database migration using Flask-Migrate - done
+
+def default_end_time(context):
+  # start_time may be assigned as a string, e.g. by db_populate.py
+  start_time = context.get_current_parameters()['start_time']
+  if isinstance(start_time, str):
+    import dateutil.parser
+    start_time = dateutil.parser.parse(start_time, ignoretz=True)
+  return start_time + Show.DEFAULT_DURATION
+
+class Show(db.Model):
+    __tablename__ = 'shows'
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey(
+        'venue.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey(
+        'artist.id'), nullable=False)
+    start_time = db.Column(db.DateTime(), nullable=False)
+    # shows listed without one last DEFAULT_DURATION
+    end_time = db.Column(db.DateTime(), nullable=False, default=default_end_time)
+
+    DEFAULT_DURATION = timedelta(hours=2)
+    # the longest show, bounds how far before a window the calendar scans start
+    MAX_DURATION = timedelta(hours=24)
+
+    __table_args__ = (
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+    )
+
+    def __repr__(self):
+      return f'''\n
+            Show: {self.id} 
+           Venue: {self.venue.name} 
+          Artist: {self.artist.name}
+      start_time: {self.start_time} '''
+
+
+class Recommendation(db.Model):
+    # written by refresh_recommendations(), read in one primary key range scan
+    __tablename__ = 'recommendation'
+    # artist-venues, venue-artists, or artist-matches and venue-matches
+    # between artists seeking a venue and venues seeking talent
+    kind = db.Column(db.String(20), primary_key=True)
+    source_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+      return f'<recommendation {self.kind} {self.source_id} #{self.rank}: {self.target_id}>'
+
+class StatCounter(db.Model):
+    # summary counters of the analytics dashboard, kept up to date by
+    # count_stats() in the transaction of every write
+    __tablename__ = 'stat_counter'
+    metric = db.Column(db.String(40), primary_key=True)
+    bucket = db.Column(db.String(250), primary_key=True)
+    total = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_stat_counter_metric_total', 'metric', 'total'),
+    )
+
+    def __repr__(self):
+      return f'<stat_counter {self.metric} {self.bucket}: {self.total}>'
+
+# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration. - done
+
+#----------------------------------------------------------------------------#
+# Analytics counters.
+#----------------------------------------------------------------------------#
+
+STATS = {
+  Venue: (VENUE_STATS, venue_buckets),
+  Artist: (ARTIST_STATS, artist_buckets),
+  Show: (SHOW_STATS, show_buckets),
+}
+
+# both postgres and sqlite >= 3.24 take ON CONFLICT
+ADD_TO_STAT = text('''
+  INSERT INTO stat_counter (metric, bucket, total) VALUES (:metric, :bucket, :delta)
+  ON CONFLICT (metric, bucket) DO UPDATE SET total = stat_counter.total + excluded.total
+''')
+
+def stat_values(instance, columns, before):
+  # the column values of a record before or after the flush
+  state = db.inspect(instance)
+  values = []
+  for column in columns:
+    history = state.attrs[column].load_history()
+    value = (history.deleted or history.unchanged) if before else (history.added or history.unchanged)
+    values.append(value[0] if value else None)
+  return values
+
+@event.listens_for(db.session, 'after_flush')
+def count_stats(session, flush_context):
+  # incremental refresh: the counters of the records the flush inserted,
+  # updated or deleted move by one in the same transaction. Bulk writes
+  # (Query.update/delete, bulk_insert_mappings) aren't seen here, run
+  # flask refresh-stats after them.
+  deltas = {}
+  def move(instance, before, step):
+    columns, buckets = STATS[type(instance)]
+    for key in buckets(*stat_values(instance, columns, before)):
+      deltas[key] = deltas.get(key, 0) + step
+
+  for instance in session.new:
+    if type(instance) in STATS:
+      move(instance, False, 1)
+  for instance in session.deleted:
+    if type(instance) in STATS:
+      move(instance, True, -1)
+  for instance in session.dirty:
+    if type(instance) in STATS and session.is_modified(instance):
+      move(instance, True, -1)
+      move(instance, False, 1)
+
+  changes = [{"metric": metric, "bucket": bucket, "delta": delta}
+             for (metric, bucket), delta in sorted(deltas.items()) if delta]
+  if changes:
+    session.connection().execute(ADD_TO_STAT, changes)
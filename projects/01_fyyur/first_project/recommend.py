@@ -0,0 +1,63 @@
+import heapq
+import math
+
+#----------------------------------------------------------------------------#
+# Recommendations from the artist x venue co-occurrence of shows.
+#----------------------------------------------------------------------------#
+
+def cooccurrence(pairs):
+    '''
+    Sparse artist x venue matrix of (artist_id, venue_id) pairs, one per
+    show: the number of shows of each artist at each venue, as dicts of
+    dicts both ways round, by artist then by venue.
+    '''
+    by_artist = {}
+    by_venue = {}
+    for artist_id, venue_id in pairs:
+        venues = by_artist.setdefault(artist_id, {})
+        venues[venue_id] = venues.get(venue_id, 0) + 1
+        artists = by_venue.setdefault(venue_id, {})
+        artists[artist_id] = artists.get(artist_id, 0) + 1
+    return by_artist, by_venue
+
+
+def similarities(rows, columns, row, norms):
+    '''
+    Cosine similarity of one row of the matrix with every other row it
+    shares a column with, through the transposed matrix so that only those
+    rows are visited.
+    '''
+    dots = {}
+    for column, count in rows[row].items():
+        for other, other_count in columns[column].items():
+            if other != row:
+                dots[other] = dots.get(other, 0) + count * other_count
+    norm = norms[row]
+    return {other: dot / (norm * norms[other]) for other, dot in dots.items()}
+
+
+def scores(rows, columns, neighbours=50):
+    '''
+    Yields (row, {column: score}) for every row of the matrix: the columns
+    its most similar rows (at most neighbours of them) use and this one
+    doesn't yet, each scored by the sum of similarity x count over those
+    rows. With rows by artist these are the venues that booked artists like
+    this one, with rows by venue the artists who played venues like this one.
+    '''
+    norms = {row: math.sqrt(sum(count * count for count in cells.values()))
+             for row, cells in rows.items()}
+    for row, cells in rows.items():
+        scored = {}
+        for other, similarity in top(similarities(rows, columns, row, norms), neighbours):
+            for column, count in rows[other].items():
+                if column not in cells:
+                    scored[column] = scored.get(column, 0) + similarity * count
+        yield row, scored
+
+
+def top(scored, k, allowed=None):
+    '''The k best (id, score) pairs, only ids in allowed if given'''
+    items = scored.items() if allowed is None else (
+        (id, score) for id, score in scored.items() if id in allowed)
+    # ties go to the oldest record
+    return heapq.nlargest(k, items, key=lambda item: (item[1], -item[0]))
@@ -0,0 +1,73 @@
+import functools
+import random
+import time
+
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy, get_state
+from sqlalchemy import event, orm
+
+#----------------------------------------------------------------------------#
+# Read replica routing.
+#----------------------------------------------------------------------------#
+
+# a client that wrote reads from the primary until the time in this cookie
+STICKY_COOKIE = 'fyyur_primary_until'
+
+
+class RoutingSession(SignallingSession):
+    '''
+    Session reading from the replica picked by read_only() for the request,
+    if any, and from the primary otherwise. Flushes always go to the primary.
+    '''
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = g.get('read_replica') if has_app_context() else None
+        if replica is None or self._flushing:
+            return super().get_bind(mapper, clause)
+        return get_state(self.app).db.get_engine(self.app, bind=replica)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def read_only(view):
+    '''
+    Decorator of the views that only read: their queries go to one of the
+    READ_REPLICAS binds, unless the client wrote less than
+    REPLICA_STICKY_SECONDS ago and must see its own writes.
+    '''
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        replicas = current_app.config.get('READ_REPLICAS')
+        if replicas and not _sticky():
+            g.read_replica = random.choice(replicas)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _sticky():
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def init_app(app, db):
+    '''Remembers the requests that wrote, and sends their clients the cookie'''
+    if not event.contains(db.session, 'after_flush', _wrote):
+        event.listen(db.session, 'after_flush', _wrote)
+    app.after_request(_stick_to_primary)
+
+
+def _wrote(session, flush_context):
+    if has_app_context():
+        g.wrote_to_primary = True
+
+
+def _stick_to_primary(response):
+    if g.get('wrote_to_primary') and current_app.config.get('READ_REPLICAS'):
+        seconds = current_app.config['REPLICA_STICKY_SECONDS']
+        response.set_cookie(STICKY_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True)
+    return response
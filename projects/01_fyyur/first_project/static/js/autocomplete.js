@@ -0,0 +1,43 @@
+// Typeahead for the artist and venue pickers of the new show form.
+// <input data-autocomplete="artists" data-target="artist_id" list="...">
+// suggests names from /autocomplete/artists as the user types, and copies
+// the id of the picked name into the hidden input named by data-target.
+document.addEventListener('DOMContentLoaded', function () {
+  var inputs = document.querySelectorAll('input[data-autocomplete]');
+  Array.prototype.forEach.call(inputs, function (input) {
+    var kind = input.getAttribute('data-autocomplete');
+    var target = document.getElementById(input.getAttribute('data-target'));
+    var options = document.getElementById(input.getAttribute('list'));
+    var ids = {};
+    var timer = null;
+
+    function pick() {
+      target.value = ids[input.value] || '';
+    }
+
+    input.addEventListener('input', function () {
+      pick();
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        var query = input.value.trim();
+        if (!query) {
+          return;
+        }
+        fetch('/autocomplete/' + kind + '?q=' + encodeURIComponent(query))
+          .then(function (response) { return response.json(); })
+          .then(function (body) {
+            ids = {};
+            options.innerHTML = '';
+            body.data.forEach(function (item) {
+              ids[item.name] = item.id;
+              var option = document.createElement('option');
+              option.value = item.name;
+              options.appendChild(option);
+            });
+            pick();
+          });
+      }, 100);
+    });
+    input.addEventListener('change', pick);
+  });
+});
@@ -0,0 +1,59 @@
+import csv
+from collections import Counter
+
+#----------------------------------------------------------------------------#
+# Counters of the analytics dashboard.
+#----------------------------------------------------------------------------#
+
+# the columns each kind of record is counted by
+VENUE_STATS = ('city', 'state', 'seeking_talent', 'genres')
+ARTIST_STATS = ('city', 'state', 'seeking_venue', 'genres')
+SHOW_STATS = ('artist_id', 'start_time')
+
+
+def split_genres(genres):
+    '''
+    Genres of a record, as assigned by the forms (a list) or as read back
+    from the database (a '{Jazz,"Rock n Roll"}' array literal)
+    '''
+    if not genres:
+        return []
+    if isinstance(genres, str):
+        genres = next(csv.reader([genres.strip().strip('{}')]), [])
+    return sorted({genre.strip() for genre in genres if genre and genre.strip()})
+
+
+def city_bucket(city, state):
+    return f'{" ".join((city or "").split())}, {(state or "").strip().upper()}'
+
+
+# the buckets functions give the (metric, bucket) pairs a record counts in,
+# e.g. ('venues_by_city', 'San Francisco, CA') or ('shows_by_month', '2019-05')
+def venue_buckets(city, state, seeking_talent, genres):
+    place = city_bucket(city, state)
+    buckets = [('totals', 'venues'), ('venues_by_city', place)]
+    if seeking_talent:
+        buckets += [('totals', 'seeking_venues'), ('seeking_venues_by_city', place)]
+    return buckets + [('venue_genres', genre) for genre in split_genres(genres)]
+
+
+def artist_buckets(city, state, seeking_venue, genres):
+    place = city_bucket(city, state)
+    buckets = [('totals', 'artists'), ('artists_by_city', place)]
+    if seeking_venue:
+        buckets += [('totals', 'seeking_artists'), ('seeking_artists_by_city', place)]
+    return buckets + [('artist_genres', genre) for genre in split_genres(genres)]
+
+
+def show_buckets(artist_id, start_time):
+    # start_time is a datetime, or the string it was assigned as
+    month = start_time.strftime('%Y-%m') if hasattr(start_time, 'strftime') else str(start_time)[:7]
+    return [('totals', 'shows'), ('shows_by_month', month), ('artist_shows', str(artist_id))]
+
+
+def count(records, buckets):
+    '''Totals of every bucket over records, tuples of the buckets arguments'''
+    totals = Counter()
+    for record in records:
+        totals.update(buckets(*record))
+    return totals
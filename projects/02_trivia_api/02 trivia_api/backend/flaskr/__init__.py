@@ -1,17 +1,29 @@
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, Response, request, abort, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+import click
 import random
 
 from models import setup_db, Question, Category
+from . import bulk, json_provider
+from .json_provider import json_response, json_stream
 
 QUESTIONS_PER_PAGE = 10
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
-  setup_db(app)
+  # JSON_BACKEND=json or orjson forces the encoder of json_provider
+  app.config.from_mapping(JSON_BACKEND=os.environ.get('JSON_BACKEND'))
+  if test_config:
+    app.config.from_mapping(test_config)
+  # test_config may point the app at another database, e.g. a temporary sqlite file
+  if app.config.get('DATABASE_PATH'):
+    setup_db(app, app.config['DATABASE_PATH'])
+  else:
+    setup_db(app)
+  json_provider.init_app(app)
   
   '''
   @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs - done
@@ -39,7 +51,7 @@ def create_app(test_config=None):
     categories = Category.query.order_by(Category.id).all()
     formatted_categories = {category.id:category.type for category in categories}
 
-    return jsonify({
+    return json_response({
 
       'success': True,
       'categories': formatted_categories,
@@ -61,34 +73,34 @@ def create_app(test_config=None):
   '''
   SELECTION_PER_PAGE = 10
   def paginate(request, selection):
+    # selection is an ordered query, only the requested page is fetched
     page = request.args.get('page', 1, type=int)
+    if page < 1:
+      return []
     start = (page - 1) * SELECTION_PER_PAGE
-    end = start + SELECTION_PER_PAGE
-    selection = [item.format() for item in selection]
-    current_selection = selection[start:end]
+    current_selection = selection.offset(start).limit(SELECTION_PER_PAGE).all()
 
-    return current_selection
+    return [item.format() for item in current_selection]
 
   @app.route('/questions', methods=['GET'])
   def get_questions():
-    selection = Question.query.order_by(Question.id).all()
-    current_questions = paginate(request, selection)
-
-    if len(current_questions) == 0:
+    page = request.args.get('page', 1, type=int)
+    start = (page - 1) * SELECTION_PER_PAGE
+    total_questions = Question.query.count()
+    if page < 1 or start >= total_questions:
       abort(404)
 
     categories = Category.query.order_by(Category.id).all()
     formatted_categories = {category.id:category.type for category in categories}
 
-
-    return jsonify({
+    # the page is encoded question by question while it is read
+    selection = Question.query.order_by(Question.id).offset(start).limit(SELECTION_PER_PAGE)
+    return json_stream({
       'success': True,
-      'questions': current_questions,
       'categories': formatted_categories,
       'current_category': None,
-      'total_questions': len(Question.query.all()),
-
-    })
+      'total_questions': total_questions,
+    }, 'questions', (question.format() for question in selection))
 
   '''
   @TODO: 
@@ -109,15 +121,15 @@ def create_app(test_config=None):
     current_category = question.category
     question.delete()
     print(f'question: {question.id} {question.question} was deleted from db.')
-    selection = Question.query.order_by(Question.id).all()
+    selection = Question.query.order_by(Question.id)
     current_questions = paginate(request, selection)
     categories = Category.query.order_by(Category.id).all()
     formatted_categories = {category.id:category.type for category in categories}
-    return jsonify({
+    return json_response({
       'success':True,
       'questions':current_questions,
       'categories': formatted_categories,
-      'total_questions': len(Question.query.all()),
+      'total_questions': Question.query.count(),
       'current_category':current_category,
     })
 
@@ -146,16 +158,79 @@ def create_app(test_config=None):
     new_category = body.get('category', None)
     new_difficulty = body.get('difficulty', None)
 
+    # category is an integer foreign key, the form posts it as a string
+    try:
+      new_category = int(new_category) if new_category is not None else None
+    except (TypeError, ValueError):
+      abort(422)
+
     question = Question(question=new_question, answer=new_answer, category=new_category, difficulty=new_difficulty)
     question.insert()
     print(f'question: {question.id} {question.question} was created!')
 
-    return jsonify({
+    return json_response({
         'success':True,
 
       })
 
 
+  '''
+  Bulk import and export of the question bank.
+
+  POST /questions/import streams a JSON Lines (default) or CSV body
+  (?format=csv or Content-Type: text/csv) with one question per line,
+  inserts the valid ones in batched transactions and reports the lines
+  that were rejected. GET /questions/export streams every question back
+  in the same formats, or as a {"success": true, "questions": [...]}
+  JSON document with ?format=json. The flask import-questions and export-questions
+  commands do the same from the command line.
+  '''
+
+  def bulk_format(default='jsonl', formats=bulk.FORMATS):
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else default)
+    if fmt not in formats:
+      abort(400)
+    return fmt
+
+  @app.route('/questions/import', methods=['POST'])
+  def import_questions():
+    fmt = bulk_format()
+    lines = (line.decode('utf-8', 'replace') for line in request.stream)
+    result = bulk.import_questions(lines, fmt)
+    print(f"questions: {result['imported']} imported, {result['total_errors']} rejected.")
+
+    return json_response({
+      'success': True,
+      **result
+    })
+
+  @app.route('/questions/export', methods=['GET'])
+  def export_questions():
+    fmt = bulk_format(formats=bulk.EXPORT_FORMATS)
+    if fmt == 'json':
+      return json_stream({'success': True}, 'questions', bulk.question_records())
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(bulk.export_questions(fmt)), mimetype=mimetype)
+
+  @app.cli.command('import-questions')
+  @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+  @click.option('--format', 'fmt', type=click.Choice(bulk.FORMATS), help='defaults to the file extension')
+  @click.option('--batch-size', default=bulk.IMPORT_BATCH_SIZE, show_default=True)
+  def import_questions_command(path, fmt, batch_size):
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    with open(path, newline='', encoding='utf-8') as lines:
+      result = bulk.import_questions(lines, fmt, batch_size)
+    for error in result['errors']:
+      click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(f"{result['imported']} questions imported, {result['total_errors']} lines rejected.")
+
+  @app.cli.command('export-questions')
+  @click.argument('output', type=click.File('w'), default='-')
+  @click.option('--format', 'fmt', type=click.Choice(bulk.FORMATS), default='jsonl', show_default=True)
+  def export_questions_command(output, fmt):
+    for chunk in bulk.export_questions(fmt):
+      output.write(chunk)
+
   '''
   @TODO: 
   Create a POST endpoint to get questions based on a search term. 
@@ -175,16 +250,21 @@ def create_app(test_config=None):
     if not search_term:
       abort(422)
     
-    questions = Question.query.filter(Question.question.ilike(f'%{search_term}%')).all()
-    if not questions:
+    # filter, rank, count and paginate in a single query
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+      # a negative OFFSET is an error on postgres
       abort(422)
-    
-    paginated_questions = paginate(request, questions)
+    questions, total_questions = Question.search(
+      search_term,
+      offset=(page - 1) * SELECTION_PER_PAGE,
+      limit=SELECTION_PER_PAGE)
 
-    return jsonify({
+    return json_response({
       'success': True,
-      'questions': paginated_questions,
-
+      'questions': [question.format() for question in questions],
+      'total_questions': total_questions,
+      'current_category': None,
     })
 
   '''
@@ -200,15 +280,15 @@ def create_app(test_config=None):
   def get_questions_by_category(category_id):
     # get categories from db
     category = Category.query.get(category_id)
-    # filter questions by category
-    questions = Question.query.filter(Question.category == category_id).all()
-    # convert questions to json friendly format
-
+    if category is None:
+      abort(404)
+    # filter questions by category, paginated by the (category, id) index
+    selection = Question.query.filter(Question.category == category_id)
 
-    return jsonify({
+    return json_response({
       'success': True,
-      'questions': paginate(request, questions),
-      'total_questions': len(questions),
+      'questions': paginate(request, selection.order_by(Question.id)),
+      'total_questions': selection.count(),
       'current_category': category.type
     })
 
@@ -261,12 +341,12 @@ def create_app(test_config=None):
       # select a random question and
       result = random.choice(selected)
       # return to frontend as a JSON object
-      return jsonify({
+      return json_response({
         'question': result
       })
     # else, return question key as false.
     else:
-      return jsonify({
+      return json_response({
         'question': False
       })
 
@@ -281,35 +361,35 @@ def create_app(test_config=None):
   '''
   @app.errorhandler(400)
   def bad_request(error):
-    return jsonify({
+    return json_response({
         'success': False,
         'error': 400,
         'message': "Bad Request: The request cannot be fulfilled due to bad syntax"
-    }), 400
+    }, 400)
   
   @app.errorhandler(404)
   def not_found(error):
-    return jsonify({
+    return json_response({
         'success': False,
         'error': 404,
         'message': "Not Found: The request resource could not be found"
-    }), 404
+    }, 404)
 
   @app.errorhandler(405)
   def not_allowed(error):
-    return jsonify({
+    return json_response({
         'success': False,
         'error': 405,
         'message': "Method not allowed"
-    }), 405
+    }, 405)
 
   @app.errorhandler(422)
   def unprocessable(error):
-    return jsonify({
+    return json_response({
         'success': False,
         'error': 422,
         'message': "Unprocessable Entity: The request was well formed but was unable to be followed due to semantic errors"
-    }), 422
+    }, 422)
 
   return app
 
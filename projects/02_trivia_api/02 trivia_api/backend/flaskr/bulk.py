@@ -0,0 +1,170 @@
+import csv
+import io
+import json
+
+from models import db, Question, Category
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+EXPORT_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+FORMATS = ('jsonl', 'csv')
+EXPORT_FORMATS = FORMATS + ('json',)
+
+'''
+read_records(lines, fmt)
+    yields (line_number, record) for every record of a JSON Lines or CSV
+    stream, record is a dict or the exception raised while parsing the line
+'''
+def read_records(lines, fmt):
+  if fmt == 'csv':
+    reader = csv.DictReader(lines)
+    while True:
+      try:
+        record = next(reader)
+      except StopIteration:
+        return
+      except csv.Error as e:
+        yield reader.line_num, e
+        continue
+      yield reader.line_num, record
+  else:
+    for line_number, line in enumerate(lines, start=1):
+      if not line.strip():
+        continue
+      try:
+        record = json.loads(line)
+        if not isinstance(record, dict):
+          raise ValueError('expected a JSON object')
+      except ValueError as e:
+        yield line_number, e
+        continue
+      yield line_number, record
+
+'''
+validate_question(record, category_ids)
+    returns the row to insert for a parsed record,
+    raises ValueError describing the first invalid field
+'''
+def validate_question(record, category_ids):
+  question = text_field(record, 'question')
+  answer = text_field(record, 'answer')
+
+  category = record.get('category')
+  difficulty = record.get('difficulty')
+  # JSON values other than numbers and strings (bool, list, object) are
+  # rejected rather than coerced by int()
+  if not all(isinstance(value, (int, str)) and not isinstance(value, bool)
+             for value in (category, difficulty)):
+    raise ValueError('category and difficulty must be integers')
+  try:
+    category = int(category)
+    difficulty = int(difficulty)
+  except ValueError:
+    raise ValueError('category and difficulty must be integers')
+  if category not in category_ids:
+    raise ValueError(f'unknown category: {category}')
+  if not 1 <= difficulty <= 5:
+    raise ValueError('difficulty must be between 1 and 5')
+
+  return {
+    'question': question,
+    'answer': answer,
+    'category': category,
+    'difficulty': difficulty
+  }
+
+def text_field(record, name):
+  value = record.get(name)
+  if value is None:
+    value = ''
+  if not isinstance(value, str):
+    raise ValueError(f'{name} must be a string')
+  value = value.strip()
+  if not value:
+    raise ValueError(f'{name} is required')
+  return value
+
+'''
+import_questions(lines, fmt, batch_size)
+    validates and inserts the questions of a JSON Lines or CSV stream,
+    one multi-row INSERT and one commit per batch of batch_size rows.
+    Invalid lines are skipped and reported, valid ones are still imported.
+'''
+def import_questions(lines, fmt='jsonl', batch_size=IMPORT_BATCH_SIZE):
+  # categories are looked up once per import, not once per line
+  category_ids = {category_id for category_id, in db.session.query(Category.id)}
+  insert = Question.__table__.insert()
+  batch = []
+  imported = 0
+  errors = []
+  total_errors = 0
+
+  def flush():
+    db.session.execute(insert.values(batch))
+    db.session.commit()
+
+  for line_number, record in read_records(lines, fmt):
+    try:
+      if isinstance(record, Exception):
+        raise ValueError(f'malformed line: {record}')
+      batch.append(validate_question(record, category_ids))
+    except ValueError as e:
+      total_errors += 1
+      if len(errors) < MAX_REPORTED_ERRORS:
+        errors.append({'line': line_number, 'error': str(e)})
+      continue
+
+    if len(batch) >= batch_size:
+      flush()
+      imported += len(batch)
+      batch = []
+
+  if batch:
+    flush()
+    imported += len(batch)
+
+  return {
+    'imported': imported,
+    'errors': errors,
+    'total_errors': total_errors
+  }
+
+def question_rows(chunk_size=IMPORT_BATCH_SIZE):
+  columns = [getattr(Question, field) for field in EXPORT_FIELDS]
+  return db.session.query(*columns) \
+    .order_by(Question.id) \
+    .yield_per(chunk_size)
+
+'''
+question_records()
+    yields every question as a dict of EXPORT_FIELDS, for the JSON export
+'''
+def question_records(chunk_size=IMPORT_BATCH_SIZE):
+  for row in question_rows(chunk_size):
+    yield dict(zip(EXPORT_FIELDS, row))
+
+'''
+export_questions(fmt)
+    yields the whole question bank as JSON Lines or CSV, chunk by chunk,
+    reading the questions table with a server side cursor
+'''
+def export_questions(fmt='jsonl', chunk_size=IMPORT_BATCH_SIZE):
+  rows = question_rows(chunk_size)
+
+  buffer = io.StringIO()
+  if fmt == 'csv':
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    write = writer.writerow
+  else:
+    def write(row):
+      buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, row))))
+      buffer.write('\n')
+
+  for count, row in enumerate(rows, start=1):
+    write(row)
+    if count % chunk_size == 0:
+      yield buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+  yield buffer.getvalue()
@@ -0,0 +1,16 @@
+--
+-- Trigram indexes for POST /questions/search
+--
+-- Question.search filters with ILIKE '%term%' on question and answer and
+-- orders by similarity(), both of which are served by these GIN indexes.
+--
+-- psql trivia < migrations/0001_question_search.sql
+--
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS ix_questions_question_trgm
+    ON public.questions USING gin (question gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS ix_questions_answer_trgm
+    ON public.questions USING gin (answer gin_trgm_ops);
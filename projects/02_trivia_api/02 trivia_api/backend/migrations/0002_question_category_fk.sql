@@ -0,0 +1,34 @@
+--
+-- Typed, indexed category foreign key on questions
+--
+-- Databases created through db.create_all() have questions.category as
+-- text. Convert it to an integer referencing categories.id, clearing values
+-- that are not a valid category, and add the (category, id) index used by
+-- the category filtered listings and quizzes.
+--
+-- psql trivia < migrations/0002_question_category_fk.sql
+--
+
+BEGIN;
+
+ALTER TABLE public.questions
+    DROP CONSTRAINT IF EXISTS category;
+
+ALTER TABLE public.questions
+    ALTER COLUMN category TYPE integer
+    USING CASE
+        WHEN trim(category::text) ~ '^[0-9]+$' THEN trim(category::text)::integer
+    END;
+
+UPDATE public.questions
+    SET category = NULL
+    WHERE category IS NOT NULL
+    AND category NOT IN (SELECT id FROM public.categories);
+
+ALTER TABLE ONLY public.questions
+    ADD CONSTRAINT category FOREIGN KEY (category) REFERENCES public.categories(id) ON UPDATE CASCADE ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS ix_questions_category_id
+    ON public.questions (category, id);
+
+COMMIT;
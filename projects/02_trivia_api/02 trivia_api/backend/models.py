@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, DDL, case, create_engine, event, func, or_
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -25,11 +25,13 @@ Question
 '''
 class Question(db.Model):  
   __tablename__ = 'questions'
+  # serves category filtered listings paginated by id, and plain category lookups
+  __table_args__ = (Index('ix_questions_category_id', 'category', 'id'),)
 
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', name='category', onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
 
   def __init__(self, question, answer, category, difficulty):
@@ -58,6 +60,50 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+  '''
+  search(search_term, offset, limit)
+      returns one page of the questions whose question or answer contains
+      search_term (case insensitive), most relevant first, together with the
+      total number of matches counted by the same query
+  '''
+  @classmethod
+  def search(cls, search_term, offset=0, limit=None):
+    pattern = '%{}%'.format(search_term)
+    matches = or_(cls.question.ilike(pattern), cls.answer.ilike(pattern))
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+      # both ilike filters are served by the pg_trgm indexes below
+      relevance = func.greatest(
+        func.similarity(cls.question, search_term),
+        func.similarity(cls.answer, search_term))
+    else:
+      relevance = case([(cls.question.ilike(pattern), 1)], else_=0)
+
+    rows = db.session.query(cls, func.count().over()) \
+      .filter(matches) \
+      .order_by(relevance.desc(), cls.id) \
+      .offset(offset) \
+      .limit(limit) \
+      .all()
+
+    if rows:
+      return [question for question, total in rows], rows[0][1]
+    # a page past the last match carries no window count
+    return [], cls.query.filter(matches).count() if offset else 0
+
+'''
+trigram indexes backing Question.search on postgres,
+existing databases get them from migrations/0001_question_search.sql
+'''
+event.listen(
+  Question.__table__,
+  'after_create',
+  DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm; '
+      'CREATE INDEX IF NOT EXISTS ix_questions_question_trgm '
+      'ON questions USING gin (question gin_trgm_ops); '
+      'CREATE INDEX IF NOT EXISTS ix_questions_answer_trgm '
+      'ON questions USING gin (answer gin_trgm_ops)').execute_if(dialect='postgresql'))
+
 '''
 Category
 
@@ -137,6 +137,69 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['message'], "Bad Request: The request cannot be fulfilled due to bad syntax")
 
 
+    def test_import_questions(self):
+        """ Tests bulk importing questions, rejecting the invalid lines """
+
+        lines = [
+            json.dumps({'question': 'Test Bulk Question 1', 'answer': 'Answer', 'category': 1, 'difficulty': 1}),
+            json.dumps({'question': 'Test Bulk Question 2', 'answer': 'Answer', 'category': 2, 'difficulty': 5}),
+            json.dumps({'question': 'Test Bulk Question 3', 'answer': 'Answer', 'category': 1000, 'difficulty': 1}),
+            '{not json',
+            json.dumps({'question': ['Test Bulk Question 4'], 'answer': 'Answer', 'category': 1, 'difficulty': 1}),
+        ]
+        res = self.client().post('/questions/import', data='\n'.join(lines),
+                                 content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['imported'], 2)
+        self.assertEqual(data['total_errors'], 3)
+        self.assertEqual([error['line'] for error in data['errors']], [3, 4, 5])
+
+        # delete imported questions from the database
+        for question in Question.query.filter(Question.question.like('Test Bulk Question%')).all():
+            question.delete()
+
+
+    def test_import_questions_csv(self):
+        """ Tests bulk importing questions from csv """
+
+        body = 'question,answer,category,difficulty\nTest Bulk Csv Question,Answer,3,2\n'
+        res = self.client().post('/questions/import?format=csv', data=body)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['imported'], 1)
+        self.assertEqual(data['total_errors'], 0)
+
+        question = Question.query.filter(Question.question == 'Test Bulk Csv Question').one_or_none()
+        self.assertEqual(question.category, 3)
+        question.delete()
+
+
+    def test_export_questions(self):
+        """ Tests streaming the question bank as json lines """
+
+        res = self.client().get('/questions/export')
+        lines = res.data.decode('utf-8').splitlines()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(lines), Question.query.count())
+        self.assertIn('answer', json.loads(lines[0]))
+
+
+    def test_400_export_questions_unknown_format(self):
+        """ Tests error 400 when exporting to an unsupported format """
+
+        res = self.client().get('/questions/export?format=xml')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+
     def test_search_questions(self):
         """ Tests the post request for searching questions """
 
@@ -146,6 +209,18 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
         self.assertTrue(data['questions'])
+        self.assertEqual(data['total_questions'], len(data['questions']))
+
+
+    def test_search_questions_matches_answer(self):
+        """ Tests that the search also looks into the answers """
+
+        res = self.client().post('/questions/search', json={'searchTerm': 'Scissorhands'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['total_questions'])
 
 
     def test_422_search_term_nonexistent_in_json_response(self):
@@ -159,14 +234,26 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['message'], "Unprocessable Entity: The request was well formed but was unable to be followed due to semantic errors")
 
 
-    def test_422_search_term_not_found_in_db(self):
+    def test_422_search_page_out_of_range(self):
+        """ Tests that a search page below 1 is rejected """
 
-        res = self.client().post('/questions/search', json={'searchTerm': 'Serendipity'})
+        res = self.client().post('/questions/search?page=0', json={'searchTerm': 'Peanut'})
         data = json.loads(res.data)
-        
+
         self.assertEqual(res.status_code, 422)
         self.assertEqual(data['success'], False)
-        self.assertTrue(data['message'], "Unprocessable Entity: The request was well formed but was unable to be followed due to semantic errors")
+
+
+    def test_search_term_not_found_in_db(self):
+        """ Tests that a search without matches returns an empty page """
+
+        res = self.client().post('/questions/search', json={'searchTerm': 'Serendipity'})
+        data = json.loads(res.data)
+        
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['questions'], [])
+        self.assertEqual(data['total_questions'], 0)
 
 
     def test_post_questions_by_category(self):
@@ -178,6 +265,17 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['total_questions'])
         self.assertEqual(data['current_category'], 'Art')
+        self.assertTrue(all(question['category'] == 2 for question in data['questions']))
+
+
+    def test_404_questions_by_nonexistent_category(self):
+        """ Tests 404 when listing the questions of a category that does not exist """
+
+        res = self.client().post('/categories/1000/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
 
 
     def test_quiz(self):
@@ -0,0 +1,127 @@
+import os
+import json
+import tempfile
+import time
+import unittest
+
+from sqlalchemy import event
+
+from flaskr import create_app
+from models import db, Question, Category
+
+# size of the seeded question bank and number of timed requests per endpoint,
+# override from the environment e.g. TRIVIA_PERF_QUESTIONS=100000
+QUESTIONS = int(os.environ.get('TRIVIA_PERF_QUESTIONS', 5000))
+CATEGORIES = int(os.environ.get('TRIVIA_PERF_CATEGORIES', 6))
+REPEAT = int(os.environ.get('TRIVIA_PERF_REPEAT', 50))
+# 95th percentile latency allowed for any endpoint, in milliseconds
+LATENCY_BUDGET_MS = float(os.environ.get('TRIVIA_PERF_LATENCY_MS', 100))
+
+# most SQL statements a single request may run
+QUERY_BUDGETS = {
+    'questions': 3,
+    'search': 2,
+    'category_questions': 3,
+    'quizzes': 1,
+}
+
+
+class TriviaPerformanceTestCase(unittest.TestCase):
+    """This class checks the latency and queries per request of the trivia API
+    against a temporary sqlite database, no postgres server is needed"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Create and seed the temporary database, start counting queries."""
+        handle, cls.database_file = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        cls.app = create_app({'DATABASE_PATH': 'sqlite:///' + cls.database_file})
+        cls.client = cls.app.test_client
+        cls.queries = 0
+
+        with cls.app.app_context():
+            db.session.execute(Category.__table__.insert().values(
+                [{'type': f'Category {i}'} for i in range(1, CATEGORIES + 1)]))
+            rows = [{
+                'question': f'Performance question {i} about category {i % CATEGORIES + 1}?',
+                'answer': f'Answer {i}',
+                'category': i % CATEGORIES + 1,
+                'difficulty': i % 5 + 1,
+            } for i in range(QUESTIONS)]
+            for start in range(0, QUESTIONS, 1000):
+                db.session.execute(Question.__table__.insert().values(rows[start:start + 1000]))
+            db.session.commit()
+
+            event.listen(db.engine, 'before_cursor_execute', cls.count_query)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Drop the temporary database"""
+        with cls.app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', cls.count_query)
+            db.session.remove()
+            db.engine.dispose()
+        os.remove(cls.database_file)
+
+    @classmethod
+    def count_query(cls, *args):
+        cls.queries += 1
+
+    def measure(self, name, method, url, body=None):
+        """Times REPEAT requests to url and checks them against the budgets"""
+
+        latencies = []
+        queries = []
+        for _ in range(REPEAT + 1):
+            before = TriviaPerformanceTestCase.queries
+            start = time.perf_counter()
+            res = getattr(self.client(), method)(url, json=body)
+            # streamed responses run their queries while the body is read
+            data = res.get_data()
+            res.close()
+            latencies.append((time.perf_counter() - start) * 1000)
+            queries.append(TriviaPerformanceTestCase.queries - before)
+            self.assertEqual(res.status_code, 200)
+
+        # the first request warms up the connection pool and is not timed
+        latencies = sorted(latencies[1:])
+        median = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f'\n{name}: median {median:.2f}ms, p95 {p95:.2f}ms, '
+              f'{max(queries)} queries per request ({QUESTIONS} questions)')
+
+        self.assertLessEqual(max(queries), QUERY_BUDGETS[name])
+        self.assertLessEqual(p95, LATENCY_BUDGET_MS)
+        return json.loads(data)
+
+    def test_questions_page(self):
+        """ Tests the cost of a page from the middle of the question list """
+
+        page = QUESTIONS // 10 // 2 + 1
+        data = self.measure('questions', 'get', f'/questions?page={page}')
+        self.assertEqual(data['total_questions'], QUESTIONS)
+
+    def test_search_questions(self):
+        """ Tests the cost of a search matching one category worth of questions """
+
+        data = self.measure('search', 'post', '/questions/search',
+                            {'searchTerm': 'about category 2?'})
+        self.assertTrue(data['questions'])
+
+    def test_questions_by_category(self):
+        """ Tests the cost of the second page of a category listing """
+
+        data = self.measure('category_questions', 'post', '/categories/3/questions?page=2')
+        self.assertEqual(len(data['questions']), 10)
+
+    def test_quizzes(self):
+        """ Tests the cost of drawing a quiz question from a category """
+
+        data = self.measure('quizzes', 'post', '/quizzes',
+                            {'previous_questions': [1, 2, 3], 'quiz_category': {'id': 4}})
+        self.assertTrue(data['question'])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
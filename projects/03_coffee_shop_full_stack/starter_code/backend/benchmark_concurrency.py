@@ -0,0 +1,129 @@
+'''
+benchmark_concurrency.py
+    measures how many menu reads per second a set of worker processes get
+    from the sqlite store, first alone and then while other workers keep
+    writing, once with the old rollback journal and once with the WAL
+    pragmas applied by setup_db()
+
+    runs against a copy of src/database/database.db, e.g.
+        python benchmark_concurrency.py --readers 4 --writers 2 --seconds 5
+'''
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from flask import Flask
+
+from src.database.models import SQLITE_PRAGMAS, db, setup_db, Drink
+
+MODES = {
+    # what setup_db() used to leave sqlite with
+    'rollback journal': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': 5000},
+    'wal': SQLITE_PRAGMAS,
+}
+
+
+def create_app(path, pragmas):
+    app = Flask(__name__)
+    app.config['SQLITE_PRAGMAS'] = pragmas
+    setup_db(app, 'sqlite:///' + path)
+    return app
+
+
+def reader(path, pragmas, stop, reads, errors):
+    app = create_app(path, pragmas)
+    with app.app_context():
+        while not stop.is_set():
+            try:
+                [drink.long() for drink in Drink.query.order_by(Drink.id).all()]
+                with reads.get_lock():
+                    reads.value += 1
+            except Exception:
+                with errors.get_lock():
+                    errors.value += 1
+            finally:
+                db.session.remove()
+
+
+def writer(path, pragmas, stop, writes, errors):
+    app = create_app(path, pragmas)
+    with app.app_context():
+        while not stop.is_set():
+            try:
+                # reload the whole menu in one transaction
+                drinks = [{'title': drink.title, 'recipe': drink.recipe} for drink in Drink.query.all()]
+                Drink.upsert(drinks)
+                with writes.get_lock():
+                    writes.value += 1
+            except Exception:
+                with errors.get_lock():
+                    errors.value += 1
+            finally:
+                db.session.remove()
+
+
+def run(path, pragmas, readers, writers, seconds):
+    stop = multiprocessing.Event()
+    reads = multiprocessing.Value('i', 0)
+    writes = multiprocessing.Value('i', 0)
+    errors = multiprocessing.Value('i', 0)
+    workers = [multiprocessing.Process(target=reader, args=(path, pragmas, stop, reads, errors))
+               for _ in range(readers)]
+    workers += [multiprocessing.Process(target=writer, args=(path, pragmas, stop, writes, errors))
+                for _ in range(writers)]
+    for worker in workers:
+        worker.start()
+
+    # let every worker open its connection before counting
+    time.sleep(0.5)
+    start_reads, start_writes, start_errors = reads.value, writes.value, errors.value
+    time.sleep(seconds)
+    result = ((reads.value - start_reads) / seconds,
+              (writes.value - start_writes) / seconds,
+              errors.value - start_errors)
+
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return result
+
+
+def seed(path, pragmas, drinks):
+    app = create_app(path, pragmas)
+    with app.app_context():
+        recipe = [{'name': 'espresso', 'color': 'brown', 'parts': 1},
+                  {'name': 'milk', 'color': 'white', 'parts': 3}]
+        Drink.upsert([{'title': f'Benchmark drink {i}', 'recipe': recipe} for i in range(drinks)])
+        db.session.remove()
+        db.get_engine(app).dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=4, help='reading worker processes')
+    parser.add_argument('--writers', type=int, default=2, help='writing worker processes')
+    parser.add_argument('--seconds', type=float, default=3, help='duration of each measurement')
+    parser.add_argument('--drinks', type=int, default=200, help='drinks added to the menu copy')
+    args = parser.parse_args()
+
+    source = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src', 'database', 'database.db')
+    directory = tempfile.mkdtemp()
+    try:
+        for mode, pragmas in MODES.items():
+            path = os.path.join(directory, mode.replace(' ', '_') + '.db')
+            shutil.copy(source, path)
+            seed(path, pragmas, args.drinks)
+
+            idle, _, _ = run(path, pragmas, args.readers, 0, args.seconds)
+            busy, writes, errors = run(path, pragmas, args.readers, args.writers, args.seconds)
+            print(f'{mode}: {idle:.0f} reads/s alone, {busy:.0f} reads/s with '
+                  f'{writes:.0f} writes/s ({busy / idle:.0%}), {errors} errors')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
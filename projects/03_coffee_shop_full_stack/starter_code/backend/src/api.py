@@ -1,15 +1,29 @@
 import os
-from flask import Flask, request, jsonify, abort
+from flask import Flask, request, abort
 from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
-from .auth.auth import AuthError, requires_auth
+from .database.models import db_drop_and_create_all, migrate_recipes, migrate_versions, setup_db, Drink
+from .auth.auth import AuthError, auth_metrics, jwks_cache, requires_auth, token_cache
+from . import json_provider
+from .json_provider import json_response
+from .menu import MenuSnapshot, snapshot_response
 
 app = Flask(__name__)
+# JSON_BACKEND=json or orjson forces the encoder of json_provider
+app.config['JSON_BACKEND'] = os.environ.get('JSON_BACKEND')
 setup_db(app)
 CORS(app)
+json_provider.init_app(app)
+
+'''
+the drink listings are served from a precomputed menu snapshot,
+rebuilt after post_drink, patch_drink or delete_drink commit
+!!NOTE with several workers set MENU_SNAPSHOT_TTL (seconds) to bound how
+long a worker serves a menu changed through another worker
+'''
+menu = MenuSnapshot(ttl=int(os.environ.get('MENU_SNAPSHOT_TTL', 0)))
 
 '''
 @TODO uncomment the following line to initialize the datbase
@@ -18,6 +32,66 @@ CORS(app)
 '''
 # db_drop_and_create_all()
 
+'''
+@NOTE uncomment the following line once to convert the recipes of a database
+created by an earlier version to the JSON recipe column
+'''
+# migrate_recipes()
+
+'''
+@NOTE uncomment the following line once to add the version column of the
+drinks to a database created by an earlier version
+'''
+# migrate_versions()
+
+'''
+parse_recipe(recipe)
+    the recipe of a request, either already decoded from a JSON body or a
+    JSON encoded query argument, as a non-empty list of ingredients with a
+    str name and color and numeric parts, a single ingredient is wrapped
+    in a list
+    aborts 422 if it isn't one, with the index of the drink when given
+'''
+def parse_recipe(recipe, index=None):
+    description = {'index': index} if index is not None else None
+    if isinstance(recipe, str):
+        try:
+            recipe = json.loads(recipe)
+        except ValueError:
+            abort(422, description=description)
+    if isinstance(recipe, dict):
+        recipe = [recipe]
+    if not isinstance(recipe, list) or not recipe or not all(map(is_ingredient, recipe)):
+        abort(422, description=description)
+    return recipe
+
+def is_ingredient(ingredient):
+    return (isinstance(ingredient, dict)
+            and isinstance(ingredient.get('name'), str)
+            and isinstance(ingredient.get('color'), str)
+            and isinstance(ingredient.get('parts'), (int, float))
+            and not isinstance(ingredient['parts'], bool))
+
+def is_title(title):
+    return isinstance(title, str) and title.strip() != ''
+
+'''
+if_match_version()
+    the drink version of the If-Match header, None without one or with
+    If-Match: *, aborts 412 if it isn't a version
+'''
+def if_match_version():
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    versions = if_match.as_set()
+    if len(versions) != 1:
+        abort(412)
+    try:
+        return int(versions.pop())
+    except ValueError:
+        abort(412)
+
 ## ROUTES
 '''
 @TODO implement endpoint
@@ -29,20 +103,15 @@ CORS(app)
 '''
 @app.route("/drinks")
 def get_drinks():
-    # query db for all drinks
-    drinks = Drink.query.all()
+    # serialized drink.short() list, queried only when the menu changed
+    snapshot = menu.get()
     # if no records on db, abort 404 returning json,
     # using custom error handler
-    if len(drinks) == 0:
+    if snapshot.count == 0:
         abort(404)
-    # format list of drink objects with drink.short() method
-    drinks = list(map(Drink.short, Drink.query.all()))
 
-    result = {
-        "success": True,
-        "drinks": drinks
-    }
-    return jsonify(result)
+    # 304 if the storefront already has this version of the menu
+    return snapshot_response(snapshot.short, snapshot.short_etag)
 
 
 '''
@@ -56,21 +125,14 @@ def get_drinks():
 @app.route("/drinks-detail")
 @requires_auth('get:drinks-detail')
 def get_drinks_details(payload):
-    # query db for all drinks
-    drinks = Drink.query.order_by(Drink.id).all()
+    # serialized drink.long() list, queried only when the menu changed
+    snapshot = menu.get()
     # if no records on db, abort 404 returning json,
     # using custom error handler
-    if len(drinks) == 0:
+    if snapshot.count == 0:
         abort(404)
 
-    # format drink for json using long method
-    formatted_drinks = [drink.long() for drink in drinks]
-
-    result = {
-        "success": True,
-        "drinks": formatted_drinks
-    }
-    return jsonify(result)
+    return snapshot_response(snapshot.long, snapshot.long_etag, private=True)
 
 
 '''
@@ -81,44 +143,44 @@ def get_drinks_details(payload):
         it should contain the drink.long() data representation - done
     returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the newly created drink - done
         or appropriate status code indicating reason for failure - done
+
+    a drink whose title already exists is updated with the new recipe (upsert)
+    the body may also be a JSON array of drinks, to load a whole menu in one
+    transaction, drinks is then the array of all the stored drinks
 '''
 @app.route("/drinks", methods=['POST',])
 @requires_auth('post:drinks')
 def post_drink(payload):
     # get title and recipe from request
-    title = request.args.get("title")
-    recipe = request.args.get("recipe")
+    drinks = [{'title': request.args.get("title"), 'recipe': request.args.get("recipe")}]
 
     body = request.get_json()
-    if body:
-        title = body['title']
-        recipe = json.dumps([body['recipe']])
+    if isinstance(body, dict):
+        drinks = [body]
+    elif isinstance(body, list):
+        drinks = body
 
-    if title is None or recipe is None:
+    if not drinks:
         abort(422)
+    for index, drink in enumerate(drinks):
+        # 422 with the index of the first drink that can't be stored
+        if not isinstance(drink, dict) or not is_title(drink.get('title')):
+            abort(422, description={'index': index})
+        drink['recipe'] = parse_recipe(drink.get('recipe'), index)
 
-    # check that drink is not already in the database
-    drink = Drink.query.filter_by(title=title).one_or_none()
-    if drink is None or drink.title != title :
-        try:
-            # create & insert object to db
-            drink = Drink(title=title, recipe=recipe)
-            drink.insert()
-            
-            # retrieve newly created drink from database
-            drink = Drink.query.filter_by(title=title).one_or_none()
-        except:   
-            abort(422)
-
-    # format drink object as array for json sending
-    formatted_drink = [drink.long()]
-
+    try:
+        # insert or update all the drinks and read them back in one statement
+        formatted_drinks = Drink.upsert(drinks)
+    except (exc.IntegrityError, exc.DataError):
+        # a value the database refuses, anything else is a server error
+        abort(422)
+    menu.invalidate()
 
     result = {
         "success": True,
-        "drinks": formatted_drink
+        "drinks": formatted_drinks
     }
-    return jsonify(result)
+    return json_response(result)
 
 '''
 @TODO implement endpoint
@@ -130,37 +192,52 @@ def post_drink(payload):
         it should contain the drink.long() data representation - done
     returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the updated drink - done
         or appropriate status code indicating reason for failure - done
+
+    only the title and/or recipe present in the JSON body (or the query
+    args) are changed. The ETag of a drink is its version, with an If-Match
+    header the update only happens if nobody changed the drink since that
+    version was read, else 412 and the client has to reload it
 '''
 @app.route("/drinks/<int:drink_id>", methods=['PATCH',])
 @requires_auth('patch:drinks')
 def patch_drink(payload, drink_id):
-    # query drink by id
-    drink = Drink.query.get(drink_id)
-
-    if drink is None:
-        abort(401)
-
     # get updates from request
-    title = request.args.get("title")
-    recipe = request.args.get("recipe")
+    body = request.get_json(silent=True)
+    if body is None:
+        body = request.args
+    if not isinstance(body, dict):
+        abort(422)
 
-    if title is None or recipe is None:
+    changes = {}
+    if 'title' in body:
+        if not is_title(body['title']):
+            abort(422)
+        changes['title'] = body['title']
+    if 'recipe' in body:
+        changes['recipe'] = parse_recipe(body['recipe'])
+    if not changes:
         abort(422)
 
-    # modify the drink object
-    drink.title = title
-    drink.recipe = recipe
-    # update to db
-    drink.update()
+    try:
+        # update the drink if it is still at the version the client read
+        drink = Drink.patch(drink_id, changes, version=if_match_version())
+    except (exc.IntegrityError, exc.DataError):
+        # e.g. another drink already has this title, patch() rolled back
+        abort(422)
 
-    formatted_drink = [drink.long()]
+    if drink is None:
+        if Drink.query.get(drink_id) is None:
+            abort(404)
+        abort(412)
+    menu.invalidate()
 
     result = {
         "success": True,
-        "drinks": formatted_drink
+        "drinks": [drink]
     }
-    return jsonify(result)
-
+    response = json_response(result)
+    response.set_etag(str(drink['version']))
+    return response
 
 '''
 @TODO implement endpoint
@@ -184,6 +261,7 @@ def delete_drink(payload, drink_id):
     deleted_id = drink.id
     try:
         drink.delete()
+        menu.invalidate()
         print(f'drink: {drink.id} {drink.title} was deleted from db.')
     except Exception:
         abort(422)
@@ -193,29 +271,50 @@ def delete_drink(payload, drink_id):
         "delete": deleted_id
     }
 
-    return jsonify(result)
+    return json_response(result)
 
 
 
+'''
+GET /metrics/auth
+    timings of each requires_auth stage, failures per AuthError code and the
+    state of the token and key caches of this worker
+    only served with AUTH_METRICS=1, keep it off the public network
+'''
+@app.route("/metrics/auth")
+def get_auth_metrics():
+    if not auth_metrics.enabled:
+        abort(404)
+
+    result = auth_metrics.stats()
+    result['token_cache'] = token_cache.stats()
+    result['jwks'] = jwks_cache.stats()
+    return json_response(result)
+
+
 '''
 Example error handling for unprocessable entity
 '''
 @app.errorhandler(422)
 def unprocessable(error):
-    return jsonify({
+    result = {
                     "success": False, 
                     "error": 422,
                     "message": "unprocessable"
-                    }), 422
+                    }
+    # e.g. the index of the rejected drink of a POST /drinks menu
+    if isinstance(error.description, dict):
+        result.update(error.description)
+    return json_response(result, 422)
 
 '''
 @TODO implement error handlers using the @app.errorhandler(error) decorator
     each error handler should return (with approprate messages):
-             jsonify({
+             json_response({
                     "success": False, 
                     "error": 404,
                     "message": "resource not found"
-                    }), 404
+                    }, 404)
 
 '''
 
@@ -226,11 +325,47 @@ def unprocessable(error):
 
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({
+    return json_response({
                     "success": False, 
                     "error": 404,
                     "message": "resource not found"
-                    }), 404
+                    }, 404)
+
+
+@app.errorhandler(400)
+def bad_request(error):
+    return json_response({
+                    "success": False, 
+                    "error": 400,
+                    "message": "bad request"
+                    }, 400)
+
+
+@app.errorhandler(401)
+def unauthorized(error):
+    return json_response({
+                    "success": False, 
+                    "error": 401,
+                    "message": "unauthorized"
+                    }, 401)
+
+
+@app.errorhandler(412)
+def precondition_failed(error):
+    return json_response({
+                    "success": False, 
+                    "error": 412,
+                    "message": "precondition failed"
+                    }, 412)
+
+
+@app.errorhandler(405)
+def method_not_allowed(error):
+    return json_response({
+                    "success": False, 
+                    "error": 405,
+                    "message": "method not allowed"
+                    }, 405)
 
 
 '''
@@ -239,8 +374,8 @@ def not_found(error):
 '''
 @app.errorhandler(AuthError)
 def handle_auth_error(err):
-    return jsonify({
+    return json_response({
                     "success": False,
                     "error": err.status_code,
                     "message": err.error['code']
-                    }), err.status_code
\ No newline at end of file
+                    }, err.status_code)
\ No newline at end of file
@@ -1,14 +1,54 @@
-import json
+import os
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from .jwks import JWKSCache
+from .metrics import AuthMetrics
+from .token_cache import TokenCache, TokenRevoked, verified_token
 
 
 AUTH0_DOMAIN = 'jjlovaglio.us.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'coffee_api'
 
+## JWKS
+'''
+Signing keys of AUTH0_DOMAIN, fetched once and kept in memory (see JWKSCache).
+Set JWKS_FILE to read them from a local JWKS file instead, e.g. to test offline
+with tokens signed by a locally generated keypair, or JWKS_URL to fetch them
+from a local stand-in of the identity provider.
+By default a refresher thread keeps the keys warm so that requests never wait
+on the provider, JWKS_BACKGROUND=0 fetches them from the request threads.
+'''
+JWKS_URL = os.environ.get('JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+JWKS_FILE = os.environ.get('JWKS_FILE')
+JWKS_TTL = int(os.environ.get('JWKS_TTL', 600))
+JWKS_TIMEOUT = float(os.environ.get('JWKS_TIMEOUT', 5))
+JWKS_BACKGROUND = os.environ.get('JWKS_BACKGROUND', '1') != '0'
+
+jwks_cache = JWKSCache(url=JWKS_URL, path=JWKS_FILE, algorithm=ALGORITHMS[0], ttl=JWKS_TTL,
+                       timeout=JWKS_TIMEOUT, background=JWKS_BACKGROUND)
+
+## Verified tokens
+'''
+Payloads of already verified tokens, kept until they expire so that repeated
+requests with the same bearer token skip the signature check (see TokenCache).
+TOKEN_CACHE_SIZE=0 disables it.
+'''
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
+
+token_cache = TokenCache(maxsize=TOKEN_CACHE_SIZE)
+
+## Metrics
+'''
+Per stage timings of requires_auth and failures per AuthError code, served by
+GET /metrics/auth (see AuthMetrics). Off unless AUTH_METRICS=1.
+'''
+AUTH_METRICS = os.environ.get('AUTH_METRICS', '0') == '1'
+
+auth_metrics = AuthMetrics(enabled=AUTH_METRICS)
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -52,29 +92,34 @@ def get_token_auth_header():
         raise AuthError({
             'code': 'invalid header',
             'description': 'token not found'
-    })
+    }, 401)
     token = parts[1]
     return token
 
 '''
 @TODO implement check_permissions(permission, payload) method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permission: string permission (i.e. 'post:drink'),
+            or a frozenset of permissions that are all required
         payload: decoded jwt payload
+        granted: optional frozenset of the payload permissions,
+            precompiled once per token by the token cache
     it should raise an AuthError if permissions are not included in the payload - done
         !!NOTE check your RBAC settings in Auth0 - done
     it should raise an AuthError if the requested permission string is not in the payload permissions array
     return true otherwise - done
 '''
-def check_permissions(permission, payload):
-    if 'permissions' not in payload:
+def check_permissions(permission, payload, granted=None):
+    if granted is None:
+        if 'permissions' not in payload:
                         raise AuthError({
                             'code': 'invalid_claims',
                             'description': 'Permissions not included in JWT.'
                         }, 401)
+        granted = verified_token(payload).permissions or frozenset()
 
-    if permission not in payload['permissions']:
-        print('permission not in payload!')
+    required = frozenset((permission,)) if isinstance(permission, str) else permission
+    if not required <= granted:
         raise AuthError({
             'code': 'unauthorized',
             'description': 'Permission not found.'
@@ -95,34 +140,38 @@ def check_permissions(permission, payload):
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 '''
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
-    unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 401)
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed. "kid" not in Auth header.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    try:
+        # a ready made jose Key, built once per JWKS refresh
+        with auth_metrics.stage('jwks'):
+            rsa_key = jwks_cache.get_key(unverified_header['kid'])
+    except Exception:
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to fetch the signing keys.'
+        }, 503)
     if rsa_key:
         try:
-            payload = jwt.decode(
-                token,
-                rsa_key,
-                algorithms=ALGORITHMS,
-                audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
-            )
+            with auth_metrics.stage('decode'):
+                payload = jwt.decode(
+                    token,
+                    rsa_key,
+                    algorithms=ALGORITHMS,
+                    audience=API_AUDIENCE,
+                    issuer='https://' + AUTH0_DOMAIN + '/'
+                )
 
             return payload
 
@@ -147,23 +196,56 @@ def verify_decode_jwt(token):
                 'description': 'Unable to find the appropriate key.'
             }, 401)
 
+'''
+authorize(required)
+    checks the bearer token of the request for the required frozenset of
+    permissions and returns its payload, raises an AuthError otherwise
+'''
+def authorize(required):
+    with auth_metrics.stage('header'):
+        token = get_token_auth_header()
+    try:
+        with auth_metrics.stage('token_cache'):
+            verified = token_cache.get(token)
+        if verified is None:
+            verified = token_cache.put(token, verify_decode_jwt(token))
+    except TokenRevoked:
+        raise AuthError({
+            'code': 'token_revoked',
+            'description': 'Token has been revoked.'
+        }, 401)
+    with auth_metrics.stage('permissions'):
+        check_permissions(required, verified.payload, verified.permissions)
+    return verified.payload
+
 '''
 @TODO implement @requires_auth(permission) decorator method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permission: string permission (i.e. 'post:drink'),
+            or a list of permissions that are all required (i.e. ['get:drinks-detail', 'patch:drinks'])
 
     it should use the get_token_auth_header method to get the token - done
     it should use the verify_decode_jwt method to decode the jwt - done
     it should use the check_permissions method validate claims and check the requested permission - done
     return the decorator which passes the decoded payload to the decorated method - done
+
+    tokens verified once are served from token_cache until they expire,
+    with their permissions already turned into a frozenset
+
+    each stage is timed, and each AuthError counted, by auth_metrics
 '''
 def requires_auth(permission=''):
+    required = frozenset((permission,)) if isinstance(permission, str) else frozenset(permission)
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            try:
+                with auth_metrics.stage('total'):
+                    payload = authorize(required)
+            except AuthError as error:
+                auth_metrics.count_error(error.error['code'])
+                raise
             return f(payload, *args, **kwargs)
 
         return wrapper
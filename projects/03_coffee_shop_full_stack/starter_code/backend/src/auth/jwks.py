@@ -0,0 +1,271 @@
+import json
+import os
+import threading
+import time
+from urllib.request import urlopen
+
+from jose import jwk
+
+
+'''
+JWKSUnavailable Exception
+raised when there is no key set to serve, because the provider couldn't be
+reached and no key set was ever fetched
+'''
+class JWKSUnavailable(Exception):
+    pass
+
+
+'''
+JWKSCache
+    an in-memory copy of the identity provider's JSON Web Key Set, keyed by kid
+
+    keys are served from memory for ttl seconds. Once they are older than
+    that they are still served for up to stale_ttl more seconds while a
+    background thread refreshes them (stale-while-revalidate). A token signed
+    with an unknown kid triggers an immediate refresh, so rotated keys are
+    picked up, but at most once every min_refresh_interval seconds so a flood
+    of forged kids can't hammer the provider. Concurrent refreshes are
+    collapsed into one fetch (single-flight).
+
+    with background=True a refresher thread, started by the first get_key()
+    of each worker process, keeps the keys warm instead: it refreshes them
+    every ttl seconds and request threads never fetch, they only wait (for
+    at most timeout seconds) for the refresher when they need keys it hasn't
+    got yet.
+
+    fetches time out after timeout seconds. After failure_threshold failed
+    fetches in a row the circuit opens: for cooldown seconds no fetch is
+    attempted and the last good key set keeps being served.
+
+    source is either the https url of the jwks.json endpoint or the path of
+    a local JWKS file, e.g. for offline testing with a locally signed keypair.
+
+    every signing key is turned into a ready to use jose Key object once per
+    refresh, not once per verified token.
+'''
+class JWKSCache:
+    def __init__(self, url=None, path=None, algorithm='RS256', ttl=600, stale_ttl=3600,
+                 min_refresh_interval=30, timeout=5, background=False,
+                 failure_threshold=3, cooldown=60):
+        if not url and not path:
+            raise ValueError('a JWKS url or file path is required')
+        self.url = url
+        self.path = path
+        self.algorithm = algorithm
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self.background = background
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self._keys = None
+        self._fetched_at = 0.0
+        self._last_attempt = float('-inf')
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._background = None
+
+        self.failures = 0
+        self._open_until = 0.0
+        self._attempted = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._refresher = None
+        self._refresher_pid = None
+        self._start_lock = threading.Lock()
+
+    '''
+    fetch()
+        reads the key set from the configured source
+    '''
+    def fetch(self):
+        if self.path:
+            with open(self.path) as jwks_file:
+                return json.load(jwks_file)
+        with urlopen(self.url, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def _load(self, jwks):
+        keys = {}
+        for key in jwks.get('keys', []):
+            if 'kid' not in key or key.get('use', 'sig') != 'sig':
+                continue
+            try:
+                keys[key['kid']] = jwk.construct(key, key.get('alg', self.algorithm))
+            except Exception:
+                # a key this server can't use, e.g. of another algorithm
+                continue
+        return keys
+
+    def circuit_open(self):
+        return time.monotonic() < self._open_until
+
+    '''
+    refresh()
+        fetches the key set once, threads calling refresh() while a fetch is
+        in flight wait for it and share its result instead of fetching again
+        while the circuit is open the last good key set is returned as is
+    '''
+    def refresh(self):
+        generation = self._generation
+        with self._lock:
+            if self._generation != generation and self._keys is not None:
+                return self._keys
+            if self.circuit_open():
+                # every attempt notifies, or waiters sleep out their timeout
+                self._attempt_done()
+                if self._keys is None:
+                    raise JWKSUnavailable('the JWKS circuit is open')
+                return self._keys
+            self._last_attempt = time.monotonic()
+            try:
+                keys = self._load(self.fetch())
+            except Exception:
+                self.failures += 1
+                if self.failures >= self.failure_threshold:
+                    self._open_until = time.monotonic() + self.cooldown
+                self._attempt_done()
+                # keep serving the last good key set if there is one
+                if self._keys is None:
+                    raise
+                return self._keys
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+            self.failures = 0
+            self._open_until = 0.0
+            self._attempt_done()
+            return keys
+
+    def _attempt_done(self):
+        with self._attempted:
+            self._generation += 1
+            self._attempted.notify_all()
+
+    def _refresh_in_background(self):
+        if self._background is not None and self._background.is_alive():
+            return
+        self._background = threading.Thread(target=self._safe_refresh, daemon=True)
+        self._background.start()
+
+    def _safe_refresh(self):
+        try:
+            self.refresh()
+        except Exception:
+            pass
+
+    '''
+    start()
+        starts the refresher thread of this process, if it isn't running
+        a worker forked from a process that started it gets its own
+    '''
+    def start(self):
+        with self._start_lock:
+            if (self._refresher is not None and self._refresher.is_alive()
+                    and self._refresher_pid == os.getpid()):
+                return
+            self._stop.clear()
+            self._refresher = threading.Thread(target=self._run, name='jwks-refresher', daemon=True)
+            self._refresher_pid = os.getpid()
+            self._refresher.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
+
+    def _run(self):
+        while True:
+            # cleared before refreshing, so a wake arriving during the
+            # refresh or the wait below isn't lost
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            self._safe_refresh()
+            if self.circuit_open():
+                delay = self._open_until - time.monotonic()
+            elif self.failures:
+                delay = min(self.ttl, self.min_refresh_interval)
+            else:
+                delay = self.ttl
+            self._wake.wait(delay)
+
+    def _wait_for_refresh(self):
+        # let the refresher fetch, and wait a bounded time for its result
+        generation = self._generation
+        self._wake.set()
+        with self._attempted:
+            self._attempted.wait_for(lambda: self._generation != generation, self.timeout)
+        return self._keys
+
+    '''
+    get_key(kid)
+        returns the Key object with the given kid, or None if the provider
+        doesn't publish one
+        raises if no key set could be fetched yet
+    '''
+    def get_key(self, kid):
+        if self.background:
+            return self._get_key_warm(kid)
+
+        keys = self._keys
+        age = time.monotonic() - self._fetched_at
+
+        if keys is None or age > self.ttl + self.stale_ttl:
+            keys = self.refresh()
+        elif age > self.ttl:
+            self._refresh_in_background()
+
+        key = keys.get(kid)
+        if key is None and time.monotonic() - self._last_attempt > self.min_refresh_interval:
+            # unknown kid, the provider may have rotated its keys
+            key = self.refresh().get(kid)
+        return key
+
+    def _get_key_warm(self, kid):
+        self.start()
+        keys = self._keys
+        if keys is None:
+            if self.circuit_open():
+                # nothing to wait for until the cooldown is over
+                raise JWKSUnavailable('the JWKS circuit is open')
+            keys = self._wait_for_refresh()
+            if keys is None:
+                raise JWKSUnavailable('no JWKS fetched yet')
+
+        key = keys.get(kid)
+        if (key is None and not self.circuit_open()
+                and time.monotonic() - self._last_attempt > self.min_refresh_interval):
+            # unknown kid, the provider may have rotated its keys
+            key = (self._wait_for_refresh() or keys).get(kid)
+        return key
+
+    '''
+    clear()
+        forgets the cached key set
+    '''
+    def clear(self):
+        with self._lock:
+            self._keys = None
+            self._fetched_at = 0.0
+            self._last_attempt = float('-inf')
+            self.failures = 0
+            self._open_until = 0.0
+            self._attempt_done()
+
+    '''
+    stats()
+        state of the key set and of the circuit breaker
+    '''
+    def stats(self):
+        return {
+            'keys': len(self._keys) if self._keys is not None else 0,
+            'age': time.monotonic() - self._fetched_at if self._keys is not None else None,
+            'failures': self.failures,
+            'circuit_open': self.circuit_open(),
+            'background': self.background,
+        }
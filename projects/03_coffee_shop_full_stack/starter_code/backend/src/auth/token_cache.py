@@ -0,0 +1,149 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+
+'''
+TokenRevoked Exception
+raised for a token that was revoked, or rejected by a revocation hook
+'''
+class TokenRevoked(Exception):
+    pass
+
+
+'''
+VerifiedToken
+a verified payload, with its permissions claim precompiled to a frozenset
+'''
+VerifiedToken = namedtuple('VerifiedToken', ['expires_at', 'payload', 'permissions'])
+
+def verified_token(payload):
+    permissions = payload.get('permissions')
+    return VerifiedToken(
+        payload.get('exp'),
+        payload,
+        frozenset(permissions) if isinstance(permissions, (list, tuple, set, frozenset)) else None)
+
+
+'''
+TokenCache
+    a bounded LRU of verified tokens, mapping the sha256 of a bearer token to
+    its decoded payload until the token's exp claim, so repeated requests with
+    the same token skip the signature check
+
+    revoke(token) drops a token and refuses it until it expires,
+    revoke_where(predicate) drops every cached payload matching predicate
+    (e.g. all tokens of a user), and hooks added with add_revocation_hook()
+    are asked about every payload before it is served, a truthy answer
+    revokes the token.
+'''
+class TokenCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hooks = []
+        self._entries = OrderedDict()
+        self._revoked = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def add_revocation_hook(self, hook):
+        self.hooks.append(hook)
+        return hook
+
+    def _check(self, key, payload):
+        if key in self._revoked or any(hook(payload) for hook in self.hooks):
+            raise TokenRevoked()
+
+    '''
+    get(token)
+        returns the cached VerifiedToken of token, or None if it has to be
+        verified, raises TokenRevoked for a revoked token
+    '''
+    def get(self, token):
+        key = self.key(token)
+        now = time.time()
+        with self._lock:
+            self._purge_revoked(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+        if entry is None:
+            if key in self._revoked:
+                raise TokenRevoked()
+            return None
+        self._check(key, entry.payload)
+        return entry
+
+    '''
+    put(token, payload)
+        caches the payload of a freshly verified token until its exp claim
+        and returns its VerifiedToken, raises TokenRevoked if the token is
+        revoked
+    '''
+    def put(self, token, payload):
+        key = self.key(token)
+        self._check(key, payload)
+        entry = verified_token(payload)
+        if not isinstance(entry.expires_at, (int, float)) or self.maxsize <= 0:
+            return entry
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def revoke(self, token, expires_at=None):
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if expires_at is None:
+                expires_at = entry.expires_at if entry else time.time() + 24 * 3600
+            self._revoked[key] = expires_at
+
+    def revoke_where(self, predicate):
+        with self._lock:
+            revoked = [key for key, entry in self._entries.items() if predicate(entry.payload)]
+            for key in revoked:
+                self._revoked[key] = self._entries.pop(key).expires_at
+        return len(revoked)
+
+    def _purge_revoked(self, now):
+        if self._revoked:
+            for key in [key for key, expires_at in self._revoked.items() if expires_at <= now]:
+                del self._revoked[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    '''
+    stats()
+        hit rate and size metrics of the cache
+    '''
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'revoked': len(self._revoked),
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
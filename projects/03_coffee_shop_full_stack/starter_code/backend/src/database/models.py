@@ -1,7 +1,11 @@
 import os
-from sqlalchemy import Column, String, Integer
+from sqlalchemy import Column, String, Integer, Text, TypeDecorator, bindparam, event, inspect, text
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.dialects.postgresql import JSONB
 from flask_sqlalchemy import SQLAlchemy
+import ast
 import json
+import sqlite3
 
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
@@ -9,16 +13,77 @@ database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filenam
 
 db = SQLAlchemy()
 
+'''
+pragmas applied to every new sqlite connection, each one can be overridden
+from the environment, e.g. SQLITE_SYNCHRONOUS=FULL
+    journal_mode WAL lets readers run while a write is in progress
+    synchronous NORMAL is durable in WAL mode except on power loss
+    busy_timeout (ms) waits for a lock instead of failing with "database is locked"
+    mmap_size (bytes) and cache_size (negative: KiB) keep the hot pages in memory
+'''
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 64 * 1024 * 1024)),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -16000)),
+}
+# connections kept open per worker process, so the pragmas run once per
+# connection instead of once per request
+SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 5))
+
+# INSERT ... ON CONFLICT needs sqlite 3.24, RETURNING needs 3.35: older
+# libraries than that read the written rows back with a separate SELECT
+SQLITE_UPSERT_VERSION = (3, 24)
+SQLITE_RETURNING_VERSION = (3, 35)
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    on sqlite, connections are pooled and tuned with SQLITE_PRAGMAS, or the
+    SQLITE_PRAGMAS config value of the app
 '''
-def setup_db(app):
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_path
+def setup_db(app, path=None):
+    path = path or database_path
+    app.config["SQLALCHEMY_DATABASE_URI"] = path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    if path.startswith('sqlite:') and sqlite3.sqlite_version_info < SQLITE_UPSERT_VERSION:
+        raise RuntimeError(f'sqlite {sqlite3.sqlite_version} is too old, Drink.upsert needs '
+                           + '.'.join(map(str, SQLITE_UPSERT_VERSION)) + ' or later')
+    sqlite_file = path.startswith('sqlite:///') and ':memory:' not in path
+    if sqlite_file:
+        app.config.setdefault("SQLITE_PRAGMAS", SQLITE_PRAGMAS)
+        app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {
+            # the default for sqlite files is to open a connection per request
+            'poolclass': QueuePool,
+            'pool_size': SQLITE_POOL_SIZE,
+            'max_overflow': SQLITE_POOL_SIZE * 2,
+            # pooled connections are handed from one request thread to the next
+            'connect_args': {'check_same_thread': False},
+        })
     db.app = app
     db.init_app(app)
 
+    if sqlite_file:
+        pragmas = app.config["SQLITE_PRAGMAS"]
+        event.listen(db.get_engine(app), 'connect',
+                     lambda connection, record: apply_pragmas(connection, pragmas))
+
+'''
+supports_returning()
+    whether the database of the session runs INSERT/UPDATE ... RETURNING
+'''
+def supports_returning():
+    if db.session.get_bind().dialect.name != 'sqlite':
+        return True
+    return sqlite3.sqlite_version_info >= SQLITE_RETURNING_VERSION
+
+def apply_pragmas(connection, pragmas):
+    cursor = connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
 '''
 db_drop_and_create_all()
     drops the database tables and starts fresh
@@ -29,6 +94,82 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+migrate_recipes()
+    converts the recipes stored by earlier versions (a JSON string in a
+    VARCHAR(180), sometimes nested in an extra list or written as a python
+    literal) to the RecipeJSON format, and the column to JSONB on postgres
+    !!NOTE run it once against an existing database, it is safe to run again
+'''
+def migrate_recipes():
+    rows = db.session.execute(text('SELECT id, recipe FROM drink')).fetchall()
+    for drink_id, recipe in rows:
+        try:
+            recipe = normalize_recipe(recipe)
+        except (ValueError, SyntaxError, TypeError):
+            raise ValueError(f'drink {drink_id} has an unreadable recipe: {recipe!r}')
+        db.session.execute(
+            text('UPDATE drink SET recipe = :recipe WHERE id = :id'),
+            {'recipe': json.dumps(recipe), 'id': drink_id})
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(text(
+            'ALTER TABLE drink ALTER COLUMN recipe TYPE JSONB USING recipe::text::jsonb'))
+    db.session.commit()
+
+'''
+migrate_versions()
+    adds the version column used for optimistic concurrency to a drink table
+    created by an earlier version, every existing drink starts at version 1
+    !!NOTE run it once against an existing database, it is safe to run again
+'''
+def migrate_versions():
+    columns = [column['name'] for column in inspect(db.engine).get_columns('drink')]
+    if 'version' not in columns:
+        db.session.execute(text('ALTER TABLE drink ADD COLUMN version INTEGER NOT NULL DEFAULT 1'))
+        db.session.commit()
+
+'''
+normalize_recipe(recipe)
+    a stored recipe of an earlier version as a list of ingredients, only
+    for migrate_recipes(): python literals are evaluated, request input is
+    checked by parse_recipe() in api.py instead
+'''
+def normalize_recipe(recipe):
+    if isinstance(recipe, str):
+        try:
+            recipe = json.loads(recipe)
+        except ValueError:
+            recipe = ast.literal_eval(recipe)
+    while isinstance(recipe, list) and len(recipe) == 1 and isinstance(recipe[0], list):
+        recipe = recipe[0]
+    if isinstance(recipe, dict):
+        recipe = [recipe]
+    return recipe
+
+'''
+RecipeJSON
+    column type of the recipe: native JSONB on postgres, JSON encoded text
+    on sqlite. Either way the recipe is decoded once, when the row is loaded,
+    and the model attribute holds the decoded list
+'''
+class RecipeJSON(TypeDecorator):
+    impl = Text
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(Text())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == 'postgresql':
+            return value
+        return json.dumps(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name == 'postgresql':
+            return value
+        return json.loads(value)
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -38,16 +179,18 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
+    # the ingredients blob - decoded once per load, see RecipeJSON
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    recipe =  Column(RecipeJSON, nullable=False)
+    # bumped by every update, sent as the ETag of the drink, see patch()
+    version = Column(Integer, nullable=False, default=1, server_default='1')
 
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
+        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in self.recipe]
         return {
             'id': self.id,
             'title': self.title,
@@ -62,16 +205,118 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.recipe,
+            'version': self.version
         }
 
+    '''
+    upsert(drinks, batch_size=500)
+        inserts the drinks, a list of {'title': ..., 'recipe': [...]} dicts,
+        with INSERT ... ON CONFLICT (title) DO UPDATE ... RETURNING, one
+        statement per batch_size drinks, and commits them in one transaction.
+        A drink whose title already exists gets the new recipe.
+        Returns the long() form of the stored drinks, in the order of their
+        titles. Works on postgres and sqlite >= 3.35, both support RETURNING,
+        sqlite from 3.24 reads the rows back with one more SELECT per batch
+        EXAMPLE
+            drinks = Drink.upsert([{'title': 'Latte', 'recipe': [{'color': 'white', 'name': 'milk', 'parts': 3}]}])
+    '''
+    @classmethod
+    def upsert(cls, drinks, batch_size=500):
+        # a title may only be hit once per statement, the last one wins
+        recipes = list({drink['title']: drink['recipe'] for drink in drinks}.items())
+        stored = []
+        try:
+            for start in range(0, len(recipes), batch_size):
+                batch = recipes[start:start + batch_size]
+                rows = {drink.title: drink for drink in cls._upsert_query(batch)}
+                # read the rows before the commit expires them
+                stored.extend(rows[title].long() for title, _ in batch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return stored
+
+    @classmethod
+    def _upsert_query(cls, batch):
+        values = []
+        params = []
+        binds = {}
+        for index, (title, recipe) in enumerate(batch):
+            values.append(f'(:title_{index}, :recipe_{index})')
+            params.append(bindparam(f'recipe_{index}', type_=RecipeJSON))
+            binds[f'title_{index}'] = title
+            binds[f'recipe_{index}'] = recipe
+
+        statement = (
+            'INSERT INTO drink (title, recipe) VALUES ' + ', '.join(values) +
+            ' ON CONFLICT (title) DO UPDATE SET recipe = excluded.recipe, version = drink.version + 1')
+        if not supports_returning():
+            db.session.execute(text(statement).bindparams(*params), binds)
+            titles = [title for title, _ in batch]
+            return cls.query.filter(cls.title.in_(titles)).populate_existing()
+
+        statement = text(
+            statement + ' RETURNING id, title, recipe, version'
+        ).bindparams(*params).columns(cls.id, cls.title, cls.recipe, cls.version)
+        return db.session.query(cls).from_statement(statement).params(**binds).populate_existing()
+
+    '''
+    patch(drink_id, changes, version=None)
+        applies changes, a dict with a new title and/or recipe, to a drink
+        with a single UPDATE ... RETURNING statement and commits, no SELECT
+        is needed (but on sqlite older than 3.35). With a version the update only happens if the drink is
+        still at that version (optimistic concurrency), either way the
+        version is bumped.
+        Returns the long() form of the updated drink, or None if there is no
+        drink with that id and version
+        EXAMPLE
+            drink = Drink.patch(1, {'title': 'Black Coffee'}, version=3)
+    '''
+    @classmethod
+    def patch(cls, drink_id, changes, version=None):
+        binds = {column: changes[column] for column in ('title', 'recipe') if column in changes}
+        assignments = [f'{column} = :{column}' for column in binds] + ['version = version + 1']
+        binds['id'] = drink_id
+        condition = 'id = :id'
+        if version is not None:
+            binds['version'] = version
+            condition += ' AND version = :version'
+
+        returning = supports_returning()
+        statement = 'UPDATE drink SET ' + ', '.join(assignments) + ' WHERE ' + condition
+        if returning:
+            statement += ' RETURNING id, title, recipe, version'
+        statement = text(statement)
+        if 'recipe' in binds:
+            statement = statement.bindparams(bindparam('recipe', type_=RecipeJSON))
+
+        try:
+            if returning:
+                statement = statement.columns(cls.id, cls.title, cls.recipe, cls.version)
+                query = db.session.query(cls).from_statement(statement).params(**binds)
+                drink = query.populate_existing().one_or_none()
+            elif db.session.execute(statement, binds).rowcount:
+                # no RETURNING on this sqlite, read the updated row back
+                drink = cls.query.filter(cls.id == drink_id).populate_existing().one()
+            else:
+                drink = None
+            # read the row before the commit expires it
+            stored = drink.long() if drink is not None else None
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return stored
+
     '''
     insert()
         inserts a new model into a database
         the model must have a unique name
         the model must have a unique id or null id
         EXAMPLE
-            drink = Drink(title=req_title, recipe=req_recipe)
+            drink = Drink(title=req_title, recipe=[{'color': 'brown', 'name': 'coffee', 'parts': 1}])
             drink.insert()
     '''
     def insert(self):
@@ -103,4 +348,4 @@ class Drink(db.Model):
         db.session.commit()
 
     def __repr__(self):
-        return json.dumps(self.short())
\ No newline at end of file
+        return f'<Drink {self.id}: {self.title}>'
\ No newline at end of file
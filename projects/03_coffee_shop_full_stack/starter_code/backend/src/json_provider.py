@@ -0,0 +1,47 @@
+import json
+
+from flask import Response, current_app
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used without it
+    orjson = None
+
+'''
+JSONProvider
+    serializes API payloads with orjson when it is installed and with the
+    stdlib json module otherwise. Every response of the app, including the
+    error handlers, goes through the provider registered by init_app(app).
+'''
+class JSONProvider:
+    mimetype = 'application/json'
+
+    def __init__(self, backend=None):
+        if backend is None:
+            backend = 'orjson' if orjson is not None else 'json'
+        if backend == 'orjson' and orjson is None:
+            raise RuntimeError('orjson is not installed')
+        if backend not in ('orjson', 'json'):
+            raise ValueError(f'unknown json backend: {backend}')
+        self.backend = backend
+
+    def dumps(self, obj):
+        if self.backend == 'orjson':
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def response(self, payload, status=200):
+        return Response(self.dumps(payload), status=status, mimetype=self.mimetype)
+
+'''
+init_app(app, backend)
+    registers the json provider of the app, backend is 'orjson', 'json'
+    or None (the JSON_BACKEND config value, else the fastest available)
+'''
+def init_app(app, backend=None):
+    provider = JSONProvider(backend or app.config.get('JSON_BACKEND'))
+    app.extensions['json_provider'] = provider
+    return provider
+
+def json_response(payload, status=200):
+    return current_app.extensions['json_provider'].response(payload, status)
@@ -0,0 +1,77 @@
+import hashlib
+import threading
+import time
+from collections import namedtuple
+
+from flask import Response, current_app, request
+
+from .database.models import Drink
+
+
+'''
+Snapshot
+one version of the menu, with both the short (GET /drinks) and the long
+(GET /drinks-detail) response bodies already serialized, and their ETags
+'''
+Snapshot = namedtuple('Snapshot', ['version', 'count', 'short', 'short_etag', 'long', 'long_etag', 'built_at'])
+
+
+'''
+MenuSnapshot
+    the menu served by the drink listings, built from the database on first
+    use and then kept until invalidate() is called after a write commits
+
+    each worker process keeps its own snapshot, ttl (seconds, 0 for never)
+    bounds how long a worker can serve a menu changed through another one
+'''
+class MenuSnapshot:
+    def __init__(self, ttl=0):
+        self.ttl = ttl
+        self.version = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._snapshot = None
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is None or (self.ttl and time.monotonic() - snapshot.built_at > self.ttl):
+            snapshot = self._build()
+        return snapshot
+
+    def _build(self):
+        version = self.version
+        drinks = Drink.query.order_by(Drink.id).all()
+        dumps = current_app.extensions['json_provider'].dumps
+        short = dumps({'success': True, 'drinks': [drink.short() for drink in drinks]})
+        long = dumps({'success': True, 'drinks': [drink.long() for drink in drinks]})
+        snapshot = Snapshot(
+            version, len(drinks),
+            short, hashlib.sha1(short).hexdigest(),
+            long, hashlib.sha1(long).hexdigest(),
+            time.monotonic())
+
+        with self._lock:
+            # don't keep a menu read before a concurrent write was committed
+            if self.version == version:
+                self._snapshot = snapshot
+        return snapshot
+
+
+'''
+snapshot_response(body, etag)
+    a 200 with the serialized body and its ETag, or a bodiless 304 when the
+    client already holds that version (If-None-Match)
+'''
+def snapshot_response(body, etag, private=False):
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    return response.make_conditional(request)
@@ -0,0 +1,39 @@
+import unittest
+
+from src.api import app
+from src.auth.auth import auth_metrics
+
+
+class AuthHeaderTestCase(unittest.TestCase):
+    """Checks that malformed Authorization headers are rejected with a 401
+    and counted by the auth metrics, no token or identity provider needed"""
+
+    def setUp(self):
+        self.client = app.test_client
+        self.enabled = auth_metrics.enabled
+        auth_metrics.enabled = True
+        auth_metrics.clear()
+
+    def tearDown(self):
+        auth_metrics.enabled = self.enabled
+        auth_metrics.clear()
+
+    def test_401_bearer_without_token(self):
+        res = self.client().get('/drinks-detail', headers={'Authorization': 'Bearer'})
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'invalid header')
+        self.assertEqual(auth_metrics.stats()['errors'], {'invalid header': 1})
+
+    def test_401_missing_header(self):
+        res = self.client().get('/drinks-detail')
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(auth_metrics.stats()['errors'], {'authorization_header_missing': 1})
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()